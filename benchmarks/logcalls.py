@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""
+Per-call cost of logging and printing at enabled and disabled levels
+
+Compares plain logging calls, LogGate-guarded calls, printf() and Printer,
+and ProjectError construction. Output goes to os.devnull, so only the
+Python-side cost is measured.
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import timeit
+import typing as t
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from cli_project import util as u  # noqa: E402
+
+log = logging.getLogger(os.path.basename(os.path.splitext(__file__)[0]))
+
+# name: (statement, enabled)
+CASES: t.Dict[str, t.Tuple[str, bool]] = {
+    "log.info enabled": ("log.info('line %s', line.strip())", True),
+    "log.info disabled": ("log.info('line %s', line.strip())", False),
+    "gate.info disabled": ("if gate.info: log.info('line %s', line.strip())", False),
+    "printf enabled": ("u.printf('line %s', line.strip())", True),
+    "Printer enabled": ("out.printf('line %s', line.strip())", True),
+    "Printer disabled": ("out.printf('line %s', line.strip())", False),
+    "out.enabled disabled": ("if out.enabled: out.printf('line %s', line.strip())", False),
+    "ProjectError()": ("u.ProjectError('line %s', line, errno=1)", True),
+    "str(ProjectError())": ("str(u.ProjectError('line %s', line, errno=1))", True),
+}
+
+
+def parse_args(argv: t.Optional[t.List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "-n", "--number", default=100000, type=int, help="Calls per run. [Default: %(default)s]"
+    )
+    parser.add_argument(
+        "-r", "--repeat", default=5, type=int, help="Runs, best is kept. [Default: %(default)s]"
+    )
+    return parser.parse_args(argv)
+
+
+def measure(stmt: str, enabled: bool, number: int, repeat: int) -> float:
+    """Return the best per-call time, in nanoseconds"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        logger = logging.getLogger("bench")
+        logger.propagate = False
+        logger.handlers[:] = [logging.StreamHandler(devnull)]
+        logger.setLevel(logging.INFO if enabled else logging.WARNING)
+        namespace = {
+            "u": u,
+            "log": logger,
+            "gate": u.LogGate(logger),
+            "out": u.Printer(threshold=u.INFO if enabled else u.WARNING, stream=devnull),
+            "line": "some input line\n",
+        }
+        best = min(timeit.repeat(stmt, globals=namespace, number=number, repeat=repeat))
+        namespace["out"].flush()
+    return 1e9 * best / number
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    log.info("%-24s %10s", "case", "ns/call")
+    for name, (stmt, enabled) in CASES.items():
+        log.info("%-24s %10.1f", name, measure(stmt, enabled, args.number, args.repeat))
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        log.error("Aborted")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+#
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""
+Cold start benchmark for the project's command-line entry point
+
+Times `python -m PACKAGE ARGS...` over several runs and reports a
+`python -X importtime` breakdown of the slowest imports. Fails if the median
+wall time exceeds --max-ms or if any module in --forbid gets imported, so
+regressions in lazy imports are caught early.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+import typing as t
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+# Costly modules that must not be imported for --version or --help
+FORBID = ("logging", "typing", "typing_extensions", "concurrent.futures")
+
+log = logging.getLogger(os.path.basename(os.path.splitext(__file__)[0]))
+
+
+def parse_args(argv: t.Optional[t.List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "-p", "--package", default="PROJECT", help="Package to run. [Default: %(default)s]"
+    )
+    parser.add_argument(
+        "-n", "--runs", default=20, type=int, help="Timed runs. [Default: %(default)s]"
+    )
+    parser.add_argument(
+        "-t", "--top", default=15, type=int, help="Imports to list. [Default: %(default)s]"
+    )
+    parser.add_argument(
+        "-m",
+        "--max-ms",
+        default=0,
+        type=float,
+        help="Fail if median wall time is above this, 0 to disable. [Default: %(default)s]",
+    )
+    parser.add_argument(
+        "-f",
+        "--forbid",
+        default=list(FORBID),
+        nargs="*",
+        metavar="MODULE",
+        help="Fail if any of these are imported. [Default: %(default)s]",
+    )
+    parser.add_argument(
+        nargs="*",
+        dest="args",
+        default=["--version"],
+        metavar="ARG",
+        help="Arguments to the entry point, use -- to separate. [Default: --version]",
+    )
+    return parser.parse_args(argv)
+
+
+def run(package: str, args: t.List[str], *options: str) -> subprocess.CompletedProcess:
+    path = os.pathsep.join(filter(None, (SRC, os.environ.get("PYTHONPATH"))))
+    env = dict(os.environ, PYTHONPATH=path)
+    return subprocess.run(
+        [sys.executable, *options, "-m", package, *args],
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def wall_times(package: str, args: t.List[str], runs: int) -> t.List[float]:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(package, args)
+        times.append(1000 * (time.perf_counter() - start))
+    return times
+
+
+def import_times(package: str, args: t.List[str]) -> t.Dict[str, t.Tuple[int, int]]:
+    """Return {module: (self_us, cumulative_us)} parsed from -X importtime"""
+    imports = {}
+    for line in run(package, args, "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    times = wall_times(args.package, args.args, args.runs)
+    median = statistics.median(times)
+    log.info(
+        "%s -m %s %s: median %.1f ms, min %.1f ms, max %.1f ms (%d runs)",
+        os.path.basename(sys.executable),
+        args.package,
+        " ".join(args.args),
+        median,
+        min(times),
+        max(times),
+        args.runs,
+    )
+
+    imports = import_times(args.package, args.args)
+    log.info("\n%10s %10s  %s", "self [ms]", "cumul [ms]", "slowest imports")
+    for name, (self_us, cumulative_us) in sorted(
+        imports.items(), key=lambda _: _[1][1], reverse=True
+    )[: args.top]:
+        log.info("%10.2f %10.2f  %s", self_us / 1000, cumulative_us / 1000, name)
+
+    status = 0
+    forbidden = [_ for _ in args.forbid if _ in imports]
+    if forbidden:
+        log.error("\nFAIL: forbidden modules imported: %s", ", ".join(forbidden))
+        status = 1
+    if args.max_ms and median > args.max_ms:
+        log.error("\nFAIL: median %.1f ms is above %.1f ms", median, args.max_ms)
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        log.error("Aborted")
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+#
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+
+"""
+Benchmark suite and regression harness for the project package
+
+Measures I/O throughput of util.openstd() for files, stdin and stdout,
+ArgumentParser construction and parse_args() latency, setup_logging() and
+ProjectError costs, and end-to-end startup. Results can be saved as a JSON
+baseline and later compared against it, failing on regressions beyond a
+threshold.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import typing as t
+
+import startup
+
+sys.path.insert(0, startup.SRC)
+
+from cli_project import util as u  # noqa: E402
+
+log = logging.getLogger(os.path.basename(os.path.splitext(__file__)[0]))
+
+# name: (function, unit, higher_is_better)
+BENCHMARKS: t.Dict[str, t.Tuple[t.Callable[["Config"], float], str, bool]] = {}
+
+
+class Config(t.NamedTuple):
+    datafile: str
+    size: int  # of datafile, in bytes
+    repeat: int
+
+
+def benchmark(name: str, unit: str, higher_is_better: bool = False) -> t.Callable:
+    """Decorator registering a benchmark function"""
+
+    def decorator(func: t.Callable[[Config], float]) -> t.Callable[[Config], float]:
+        BENCHMARKS[name] = (func, unit, higher_is_better)
+        return func
+
+    return decorator
+
+
+def best_of(func: t.Callable[[], object], repeat: int) -> float:
+    """Return the best wall time of repeat calls of func, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def per_call(stmt: t.Callable[[], object], repeat: int, number: int = 1000) -> float:
+    """Return the best time of a single call of stmt, in microseconds"""
+    return 1e6 * min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def child_throughput(config: Config, code: str, stdin: t.Any, stdout: t.Any) -> float:
+    """Run code in a child Python, which prints its own elapsed time, return MB/s"""
+    code = "import time; from cli_project import util as u\n" + code
+    env = dict(os.environ, PYTHONPATH=startup.SRC)
+    elapsed = []
+    for _ in range(config.repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", code, str(config.size)],
+            stdin=stdin,
+            stdout=stdout,
+            stderr=subprocess.PIPE,
+            env=env,
+            check=True,
+            universal_newlines=True,
+        )
+        elapsed.append(float(proc.stderr))
+        if hasattr(stdin, "seek"):
+            stdin.seek(0)
+    return config.size / min(elapsed) / 2**20
+
+
+# -----------------------------------------------------------------------------
+# Benchmarks
+
+
+@benchmark("openstd read file", "MB/s", higher_is_better=True)
+def read_file(config: Config) -> float:
+    def read() -> None:
+        with u.openstd(config.datafile, "rb") as fh:
+            for _ in u.iter_chunks(fh):
+                pass
+
+    return config.size / best_of(read, config.repeat) / 2**20
+
+
+@benchmark("openstd write file", "MB/s", higher_is_better=True)
+def write_file(config: Config) -> float:
+    chunk = bytes(u.CHUNK_SIZE)
+    path = config.datafile + ".out"
+
+    def write() -> None:
+        with u.openstd(path, "wb") as fh:
+            for _ in range(config.size // len(chunk)):
+                fh.write(chunk)
+
+    try:
+        return config.size / best_of(write, config.repeat) / 2**20
+    finally:
+        os.unlink(path)
+
+
+@benchmark("openstd read stdin", "MB/s", higher_is_better=True)
+def read_stdin(config: Config) -> float:
+    code = """
+start = time.perf_counter()
+with u.openstd("-", "rb") as fh:
+    for _ in u.iter_chunks(fh):
+        pass
+print(time.perf_counter() - start, file=__import__("sys").stderr)
+"""
+    with open(config.datafile, "rb") as stdin:
+        return child_throughput(config, code, stdin, subprocess.DEVNULL)
+
+
+@benchmark("openstd write stdout", "MB/s", higher_is_better=True)
+def write_stdout(config: Config) -> float:
+    code = """
+import sys
+size, chunk = int(sys.argv[1]), bytes(u.CHUNK_SIZE)
+start = time.perf_counter()
+with u.openstd("-", "wb") as fh:
+    for _ in range(size // len(chunk)):
+        fh.write(chunk)
+    fh.flush()
+print(time.perf_counter() - start, file=sys.stderr)
+"""
+    return child_throughput(config, code, subprocess.DEVNULL, subprocess.PIPE)
+
+
+@benchmark("ArgumentParser()", "us")
+def parser_construction(config: Config) -> float:
+    return per_call(lambda: u.ArgumentParser(description=__doc__), config.repeat)
+
+
+@benchmark("ArgumentParser.parse_args()", "us")
+def parser_parse_args(config: Config) -> float:
+    parser = u.ArgumentParser(description=__doc__)
+    parser.add_argument("-a", "--argument", default="somearg")
+    parser.add_argument(nargs="*", dest="infiles", default=["-"])
+    argv = ["-v", "-a", "value", "file1", "file2"]
+    return per_call(lambda: parser.parse_args(argv), config.repeat)
+
+
+@benchmark("setup_logging()", "us")
+def setup_logging(config: Config) -> float:
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+
+    def setup() -> None:
+        root.handlers.clear()
+        u.setup_logging(fmt="%(levelname)-8s: %(message)s")
+
+    try:
+        return per_call(setup, config.repeat)
+    finally:
+        root.handlers[:], root.level = saved
+
+
+@benchmark("ProjectError()", "us")
+def project_error(config: Config) -> float:
+    return per_call(
+        lambda: u.ProjectError("Error %s in %s", 42, "file", errno=1),
+        config.repeat,
+        number=10000,
+    )
+
+
+@benchmark("startup --version", "ms")
+def startup_version(config: Config) -> float:
+    args = ["--version"]
+    return statistics.median(startup.wall_times("cli_project", args, 2 * config.repeat))
+
+
+@benchmark("startup INPUT_FILE", "ms")
+def startup_file(config: Config) -> float:
+    args = ["-q", os.devnull]
+    return statistics.median(startup.wall_times("cli_project", args, 2 * config.repeat))
+
+
+# -----------------------------------------------------------------------------
+# Harness
+
+
+def parse_args(argv: t.Optional[t.List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "-s", "--save", metavar="FILE", help="Save results as a JSON baseline to FILE."
+    )
+    parser.add_argument(
+        "-c", "--compare", metavar="FILE", help="Compare results against JSON baseline FILE."
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        default=10,
+        type=float,
+        metavar="PERCENT",
+        help="Regression threshold for --compare. [Default: %(default)s%%]",
+    )
+    parser.add_argument(
+        "-r", "--repeat", default=5, type=int, help="Runs, best is kept. [Default: %(default)s]"
+    )
+    parser.add_argument(
+        "-m",
+        "--megabytes",
+        default=64,
+        type=int,
+        help="Size of I/O benchmarks data. [Default: %(default)s]",
+    )
+    parser.add_argument(
+        "-k", dest="filter", default="", help="Only run benchmarks whose name contains this."
+    )
+    return parser.parse_args(argv)
+
+
+def run(config: Config, name_filter: str = "") -> t.Dict[str, t.Dict[str, t.Any]]:
+    results = {}
+    for name, (func, unit, higher_is_better) in BENCHMARKS.items():
+        if name_filter not in name:
+            continue
+        value = func(config)
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        log.info("%-30s %12.2f %s", name, value, unit)
+    return results
+
+
+def compare(
+    results: t.Dict[str, t.Dict[str, t.Any]], baseline: t.Dict[str, t.Any], threshold: float
+) -> t.List[str]:
+    """Log a comparison table and return the names of regressed benchmarks"""
+    regressions = []
+    log.info("\n%-30s %12s %12s %8s", "benchmark", "baseline", "current", "change")
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            log.info("%-30s %12s %12.2f %8s", name, "-", result["value"], "new")
+            continue
+        old, new = baseline["results"][name]["value"], result["value"]
+        change = 100 * (new - old) / old if old else 0.0
+        worse = -change if result["higher_is_better"] else change
+        status = ""
+        if worse > threshold:
+            regressions.append(name)
+            status = "  REGRESSION"
+        log.info("%-30s %12.2f %12.2f %+7.1f%%%s", name, old, new, change, status)
+    return regressions
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datafile = os.path.join(tmpdir, "data.bin")
+        size = args.megabytes * 2**20
+        with open(datafile, "wb") as fh:
+            for _ in range(args.megabytes):
+                fh.write(os.urandom(2**20))
+        results = run(Config(datafile, size, args.repeat), args.filter)
+
+    if args.save:
+        data = {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "node": platform.node(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": results,
+        }
+        with open(args.save, "w") as fh:
+            json.dump(data, fh, indent=2)
+        log.info("\nSaved baseline to %s", args.save)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            log.error(
+                "\nFAIL: %d regression(s) beyond %s%%: %s",
+                len(regressions),
+                args.threshold,
+                ", ".join(regressions),
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        log.error("Aborted")
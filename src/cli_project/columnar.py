@@ -0,0 +1,235 @@
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+"""
+Filters and aggregations over delimited numeric tables, one row per line
+
+Input is read in large blocks of whole lines. With NumPy, from the `fast`
+extra, each block is parsed into a 2-D array in a single call, and filters
+and aggregations run vectorized over whole columns. Without it, the pure
+Python engine does the same row by row, with the same results up to float
+rounding.
+"""
+from __future__ import annotations
+
+import itertools
+import operator
+
+from . import util as u
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import typing_extensions as t
+
+    Condition = t.Tuple[int, str, float]  # (0-based column, OPERATORS key, number)
+
+log = u.get_logger(__name__)
+
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+ENGINES = ("auto", "numpy", "python")
+OPERATORS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+# Bytes of input parsed at once
+BLOCK_SIZE = 16 * u.CHUNK_SIZE
+
+
+def iter_blocks(fh: t.BinaryIO, size: int = BLOCK_SIZE) -> t.Iterator[bytes]:
+    """Yield blocks of whole lines of a binary file, each about size bytes"""
+    rest = b""
+    for chunk in u.iter_chunks(fh, size):
+        data = rest + chunk
+        cut = data.rfind(b"\n") + 1
+        if cut:
+            yield data[:cut]
+        rest = data[cut:]
+    if rest:
+        yield rest
+
+
+class _PythonEngine:
+    """Row by row parsing, filtering and aggregating, as lists of floats"""
+
+    def __init__(self, delimiter: bytes, where: t.Sequence[Condition]):
+        self.delimiter = None if delimiter.isspace() else delimiter
+        self.where = [(column, OPERATORS[op], number) for column, op, number in where]
+        self.columns = 0
+        self.count = 0
+        self.sum: list[float] = []
+        self.min: list[float] = []
+        self.max: list[float] = []
+
+    def _check(self, columns: int) -> None:
+        """Set the number of columns from the first row, checking it against where"""
+        self.columns = columns
+        for column, _, _ in self.where:
+            if column >= columns:
+                raise ValueError(f"no column {column + 1}, rows have {columns}")
+        self.sum = [0.0] * columns
+        self.min = [float("inf")] * columns
+        self.max = [float("-inf")] * columns
+
+    def select(self, block: bytes, lines: bool = False) -> tuple[list[bytes], t.Any]:
+        """Parse block, returning its rows matching where, and their lines if asked"""
+        selected: list[bytes] = []
+        rows: list[list[float]] = []
+        block = block.rstrip()
+        if not block:
+            return selected, rows
+        split = self.delimiter
+        for line in block.split(b"\n"):
+            row = [float(_) for _ in line.split(split)]
+            if len(row) != self.columns:
+                if self.columns:
+                    raise ValueError(f"row with {len(row)} columns instead of {self.columns}")
+                self._check(len(row))
+            if all(op(row[column], number) for column, op, number in self.where):
+                rows.append(row)
+                if lines:
+                    selected.append(line)
+        return selected, rows
+
+    def update(self, rows: t.Any) -> None:
+        """Add rows to the running aggregates"""
+        if not rows:
+            return
+        self.count += len(rows)
+        for i, values in enumerate(zip(*rows)):
+            self.sum[i] += sum(values)
+            self.min[i] = min(self.min[i], min(values))
+            self.max[i] = max(self.max[i], max(values))
+
+    def aggregate(self, name: str) -> list[float]:
+        """One value per column of an AGGREGATES function, over all updated rows"""
+        if name == "count":
+            return [self.count] * self.columns
+        if name == "sum":
+            return self.sum
+        if not self.count:
+            return [float("nan")] * self.columns
+        if name == "mean":
+            return [_ / self.count for _ in self.sum]
+        return self.min if name == "min" else self.max
+
+
+class _NumpyEngine(_PythonEngine):
+    """Block by block parsing, filtering and aggregating, as 2-D NumPy arrays"""
+
+    def __init__(self, delimiter: bytes, where: t.Sequence[Condition]):
+        import numpy
+
+        super().__init__(delimiter, where)
+        self.np = numpy
+        # Lookup table of whitespace bytes, as parsed by bytes.split()
+        self.whitespace = numpy.zeros(256, dtype=bool)
+        self.whitespace[list(b" \t\n\r\x0b\x0c")] = True
+
+    def select(self, block: bytes, lines: bool = False) -> tuple[list[bytes], t.Any]:
+        np = self.np
+        block = block.rstrip()
+        if not block:
+            return [], np.empty((0, self.columns))
+        if not self.columns:
+            self._check(len(block.split(b"\n", 1)[0].split(self.delimiter)))
+        text = block if self.delimiter is None else block.replace(self.delimiter, b" ")
+        # Parses any whitespace as a separator, so columns are counted per row first,
+        # as the fields starting after whitespace up to each newline
+        data = np.frombuffer(text, dtype=np.uint8)
+        space = self.whitespace[data]
+        starts = ~space
+        starts[1:] &= space[:-1]
+        ends = np.append(np.flatnonzero(data == ord("\n")), len(data) - 1)
+        columns = np.diff(np.cumsum(starts)[ends], prepend=0)
+        wrong = np.flatnonzero(columns != self.columns)
+        if wrong.size:
+            raise ValueError(f"row with {columns[wrong[0]]} columns instead of {self.columns}")
+        values = np.fromstring(text, dtype=np.float64, sep=" ")
+        count = len(columns)
+        if values.size != count * self.columns:
+            raise ValueError("non-numeric values")
+        rows = values.reshape(count, self.columns)
+        if not self.where:
+            return (block.split(b"\n") if lines else []), rows
+        mask = np.ones(count, dtype=bool)
+        for column, op, number in self.where:
+            mask &= op(rows[:, column], number)
+        selected = list(itertools.compress(block.split(b"\n"), mask.tolist())) if lines else []
+        return selected, rows[mask]
+
+    def update(self, rows: t.Any) -> None:
+        if not len(rows):
+            return
+        np = self.np
+        self.count += len(rows)
+        self.sum = np.add(self.sum, rows.sum(axis=0))
+        self.min = np.minimum(self.min, rows.min(axis=0))
+        self.max = np.maximum(self.max, rows.max(axis=0))
+
+    def aggregate(self, name: str) -> list[float]:
+        return self.np.asarray(super().aggregate(name)).tolist()  # type: ignore
+
+
+def have_numpy() -> bool:
+    """True if the NumPy engine is available"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def process(
+    paths: t.Iterable[u.PathLike],
+    out: u.Serializer,
+    delimiter: str = ",",
+    where: t.Sequence[Condition] = (),
+    aggregate: t.Sequence[str] = (),
+    engine: str = "auto",
+) -> None:
+    """
+    Filter the rows of delimited numeric files, writing them or their aggregates
+
+    Rows are written as they are read, as the original lines for the text
+    format and as lists of numbers for the others. With aggregate, only one
+    row per function is written at the end instead, with its name and then a
+    value per column, over the rows of all paths.
+
+    - delimiter -- Between columns. Any whitespace means any run of whitespace.
+    - where -- Conditions all rows must meet: (column, operator, number), with
+        a 0-based column and an OPERATORS key.
+    - aggregate -- Names from AGGREGATES.
+    - engine -- From ENGINES, "auto" being NumPy if installed.
+    """
+    if engine == "auto":
+        engine = "numpy" if have_numpy() else "python"
+    if engine == "numpy" and not have_numpy():
+        raise u.ProjectError("The numpy engine requires NumPy, see the 'fast' extra")
+    log.debug("Columnar engine: %s", engine)
+    cls = _NumpyEngine if engine == "numpy" else _PythonEngine
+    table = cls(delimiter.encode(), where)
+    text = out.format == "text"
+    lines = text and not aggregate
+    for path in paths:
+        with u.openstd(path, "rb") as fh:
+            try:
+                for block in iter_blocks(fh):
+                    selected, rows = table.select(block, lines)
+                    if aggregate:
+                        table.update(rows)
+                    elif lines:
+                        if selected:
+                            out.write(b"\n".join(selected))
+                    else:
+                        for row in rows if isinstance(rows, list) else rows.tolist():
+                            out.write(row)
+            except ValueError as e:
+                raise u.ProjectError("Invalid numeric table %r: %s", path, e)
+    for name in aggregate:
+        row = [name, *table.aggregate(name)]
+        out.write(delimiter.join(str(_) for _ in row) if text else row)
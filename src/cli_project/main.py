@@ -11,25 +11,84 @@ Whatever goes here is a nice candidate as the README's abstract, and vice-versa.
 """
 from __future__ import annotations
 
-import logging
+import functools
+import os
 import sys
 
 from . import util as u
 
+if u.TYPE_CHECKING:
+    import argparse
+    import logging
+
+    import typing_extensions as t
+
 __version__ = "2023.9.1"  # no leading zeros! https://semver.org/#spec-item-2
 
-log: logging.Logger = logging.getLogger(__package__)
+log: logging.Logger = u.get_logger(__package__)
+
 
+def shard_spec(value: str) -> tuple[int, int]:
+    """argparse type for --shard K/N, returning (K, N)"""
+    import argparse
+
+    try:
+        part, parts = (int(_) for _ in value.split("/"))
+    except ValueError:
+        part = parts = 0
+    if not 1 <= part <= parts:
+        raise argparse.ArgumentTypeError(f"must be K/N, with 1 <= K <= N: {value!r}")
+    return part, parts
 
-def cli(argv: list[str] | None = None) -> None:
-    """Command-line argument handling and logging setup"""
-    parser = u.ArgumentParser(description=__doc__, version=__version__)
+
+def where_spec(value: str) -> tuple[int, str, float]:
+    """argparse type for --where COLUMN OP NUMBER, returning a columnar condition"""
+    import argparse
+    import re
+
+    from .columnar import OPERATORS
+
+    ops = "|".join(re.escape(_) for _ in OPERATORS)
+    match = re.fullmatch(rf"\s*(\d+)\s*({ops})\s*(\S+)\s*", value)
+    try:
+        column, op, number = int(match[1]), match[2], float(match[3])  # type: ignore
+    except (TypeError, ValueError):
+        column = 0
+    if column < 1:
+        raise argparse.ArgumentTypeError(
+            f"must be COLUMN OP NUMBER, with COLUMN >= 1 and OP one of {' '.join(OPERATORS)}:"
+            f" {value!r}"
+        )
+    return column - 1, op, number
+
+
+def aggregate_spec(value: str) -> tuple[str, ...]:
+    """argparse type for --aggregate FUNC[,FUNC...]"""
+    import argparse
+
+    from .columnar import AGGREGATES
+
+    names = tuple(_.strip() for _ in value.split(","))
+    invalid = [_ for _ in names if _ not in AGGREGATES]
+    if invalid:
+        raise argparse.ArgumentTypeError(
+            f"invalid {', '.join(map(repr, invalid))}, choose from {', '.join(AGGREGATES)}"
+        )
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def get_parser() -> u.ArgumentParser:
+    """Build the command-line parser once, frozen for safe reuse by cli()"""
+    from .columnar import ENGINES
+
+    parser = u.ArgumentParser(description=__doc__, cache_options=True, version=__version__)
     parser.add_argument(
-        nargs="?",
-        default="-",
-        dest="infile",
+        nargs="*",
+        default=["-"],
+        dest="infiles",
         metavar="INPUT_FILE",
-        help="Input file to import from. [Default: stdin]",
+        help="Input files to import from, possibly compressed. [Default: stdin]",
     )
     parser.add_argument(
         "-o",
@@ -46,24 +105,557 @@ def cli(argv: list[str] | None = None) -> None:
         metavar="ARG",
         help="A string argument with a default value. [Default: %(default)s]",
     )
+    parser.add_argument(
+        "--mmap",
+        default=False,
+        action="store_true",
+        help="Memory-map INPUT_FILE for fast random access and repeated scans."
+        " Falls back to buffered reads for pipes and other non-regular files.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Read INPUT_FILEs ahead with N threads, for many small files on slow"
+        " or network storage. They are still processed in order, also with -j.",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="FILE",
+        help="Only process records appended to INPUT_FILEs since the last run,"
+        " keeping checkpoints in FILE. Rotated or truncated files are processed"
+        " from the start.",
+    )
+    parser.add_argument(
+        "-f",
+        "--follow",
+        default=False,
+        action="store_true",
+        help="Keep processing records as they are appended to INPUT_FILE, like"
+        " tail -F, until interrupted. Use with --resume to start from the last run.",
+    )
+    parser.add_argument(
+        "--records",
+        default=False,
+        action="store_true",
+        help="Process INPUT_FILEs record by record, one per line, instead of as"
+        " whole files. With -j, a large INPUT_FILE is split into byte ranges of"
+        " records processed in parallel.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=shard_spec,
+        metavar="K/N",
+        help="Only process the K-th of N contiguous shards of the input: a run of"
+        " INPUT_FILEs or, for a single INPUT_FILE, the records in a byte range of it,"
+        " implying --records. Merging the outputs of all N shards gives the same"
+        " output as 1/1.",
+    )
+    parser.add_argument(
+        "--merge",
+        default=False,
+        action="store_true",
+        help="Concatenate INPUT_FILEs, the outputs of --shard 1/N to N/N in order,"
+        " decompressing them if needed.",
+    )
+    parser.add_argument(
+        "-w",
+        "--where",
+        action="append",
+        type=where_spec,
+        metavar="COLUMN OP NUMBER",
+        help="Treat INPUT_FILEs as delimited numeric tables, one row per line, and"
+        " only output rows whose COLUMN, from 1, compares to NUMBER with OP: one of"
+        " < <= == != >= >, as in '3>=0.5'. Repeat to require all.",
+    )
+    parser.add_argument(
+        "-A",
+        "--aggregate",
+        type=aggregate_spec,
+        metavar="FUNC[,FUNC...]",
+        help="Treat INPUT_FILEs as delimited numeric tables, and only output the"
+        " per-column FUNCs of all their rows, or of those selected by --where:"
+        " count, sum, mean, min or max.",
+    )
+    parser.add_argument(
+        "-d",
+        "--delimiter",
+        default=",",
+        help="Column delimiter for --where and --aggregate, a space for any run of"
+        " whitespace. [Default: %(default)r]",
+    )
+    parser.add_argument(
+        "--engine",
+        default="auto",
+        choices=ENGINES,
+        help="Engine for --where and --aggregate: numpy, vectorized, requires the"
+        " 'fast' extra; python; or auto, numpy if installed. [Default: %(default)s]",
+    )
+    parser.add_argument(
+        "-F",
+        "--output-format",
+        default="text",
+        choices=u.OUTPUT_FORMATS,
+        help="Output results as text lines, JSON Lines, CSV rows or length-prefixed"
+        " binary frames for chaining tools. [Default: %(default)s]",
+    )
+    parser.add_argument(
+        "-k",
+        "--keep-going",
+        default=False,
+        action="store_true",
+        help="On errors in an INPUT_FILE or record, skip it and keep going, reporting"
+        " a summary of all errors at the end and exiting with status 1.",
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        default="none",
+        choices=tuple(u.COMPRESSION),
+        metavar="FORMAT",
+        help="Compress output with FORMAT, one of %(choices)s.",
+    )
+    parser.add_argument(
+        "--async",
+        dest="aio",
+        default=False,
+        action="store_true",
+        help="Process INPUT_FILEs concurrently in an asyncio loop, overlapping"
+        " reads and writes. Use -j for the number of concurrent inputs, 0 for all."
+        " Results are not cached, and output can not be compressed.",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="MANIFEST",
+        help="Run once for each line of MANIFEST, all in this process: a JSON array"
+        " of arguments, or shell-quoted arguments. Use - for stdin. Use -j to run"
+        " items in parallel worker processes, their output possibly interleaved."
+        " Items may set -q or -v for themselves, but not --log-queue, --batch or"
+        " --serve.",
+    )
+    parser.add_argument(
+        "--serve",
+        default=False,
+        action="store_true",
+        help="Run as a server for PROJECT-client, keeping imports warm and running"
+        " each request in a forked process. Requests run one at a time, unless -j"
+        " sets how many run concurrently, 0 for the number of CPUs.",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Server socket path for --serve."
+        " [Default: $PROJECT_SOCKET, or PROJECT-UID.sock in $XDG_RUNTIME_DIR or /tmp]",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        metavar="N",
+        help="Process INPUT_FILEs in parallel using N worker processes,"
+        " 0 to use all CPUs. [Default: %(default)s]",
+    )
+    return parser.freeze()
+
+
+def cli(argv: list[str] | None = None, item: bool = False) -> int:
+    """Command-line argument handling and logging setup
 
+    Return the number of errors skipped with --keep-going, after reporting them.
+    With item, argv is a --batch item, run after logging was set up by the batch.
+    """
+    parser = get_parser()
     args = parser.parse_args(argv)
-    u.setup_logging(level=args.loglevel, fmt="%(levelname)-8s: %(message)s")
+    if item and args.batch:
+        parser.error("can not be nested in a --batch item", "--batch")
+    if item and args.serve:
+        parser.error("can not be used in a --batch item", "--serve")
+    if item and args.log_queue:
+        parser.error("can only be set for the whole --batch", "--log-queue")
+    if args.jobs < 0:
+        parser.error("must be a non-negative integer", "--jobs")
+    if args.jobs != 1 and "-" in args.infiles and not (args.serve or args.aio or args.batch):
+        parser.error("stdin can not be read by parallel workers", "--jobs")
+    if args.prefetch < 0:
+        parser.error("must be a non-negative integer", "--prefetch")
+    if args.prefetch and args.mmap:
+        parser.error("can not be combined with --mmap", "--prefetch")
+    if args.prefetch and (
+        args.records
+        or args.where
+        or args.aggregate
+        or args.resume
+        or args.follow
+        or args.merge
+        or args.aio
+        or (args.shard and len(args.infiles) == 1)
+    ):
+        parser.error(
+            "only reads whole INPUT_FILEs, not for --records, --where, --aggregate,"
+            " --resume, --follow, --merge, --async or --shard of a single INPUT_FILE",
+            "--prefetch",
+        )
+    if (args.resume or args.follow) and "-" in args.infiles:
+        parser.error("stdin can not be resumed or followed", "--resume")
+    if args.follow and len(args.infiles) > 1:
+        parser.error("only a single INPUT_FILE can be followed", "--follow")
+    if args.shard and "-" in args.infiles:
+        parser.error("stdin can not be sharded", "--shard")
+    if args.shard and (args.resume or args.follow):
+        parser.error("can not be combined with --resume or --follow", "--shard")
+    if (args.where or args.aggregate) and (args.resume or args.follow or args.merge):
+        parser.error("can not be combined with --resume, --follow or --merge", "--where")
+    if (args.where or args.aggregate) and args.shard and len(args.infiles) == 1:
+        parser.error("can not split a single INPUT_FILE with --where", "--shard")
+    if args.aio and args.compress != "none":
+        parser.error("can not compress output", "--async")
+    with parser.timings("setup_logging"):
+        u.setup_logging(
+            level=args.loglevel, fmt="%(levelname)-8s: %(message)s", queue=args.log_queue
+        )
+        if item and args.loglevel != parser.get_default("loglevel"):
+            # Logging is already set up, by the batch, so only set the item's -q or -v
+            log.root.setLevel(args.loglevel)
     log.debug(args)
 
+    if args.serve:
+        from . import module, server  # noqa: F401  # module is imported to keep it warm
+
+        server.serve(run, path=args.socket, jobs=args.jobs)
+        return 0
+
+    if args.batch:
+        with parser.timings("work"):
+            failed, total = batch(args)
+        if failed:
+            raise u.ProjectError("%d of %d batch items failed", failed, total)
+        return 0
+
     log.info("Hello World!")
+    errors = u.ErrorLog() if args.keep_going else None
+    try:
+        work(args, errors)
+    finally:
+        u.metrics.set("errors", len(errors or ()))
+        if errors is not None:
+            errors.report(log)
+    return len(errors or ())
 
 
-def run(argv: list[str] | None = None) -> None:
-    """CLI entry point, handling exceptions from cli() and setting exit code"""
+def work(args: argparse.Namespace, errors: u.ErrorLog | None = None) -> None:
+    """Processing paths of cli(), once options are checked and logging is set up
+
+    With --keep-going, errors are collected in errors, reported by cli().
+    """
+    parser = get_parser()
+
+    if args.aio:
+        import asyncio
+
+        with parser.timings("work"):
+            asyncio.run(acli(args, errors))
+        return
+
+    if args.merge:
+        with parser.timings("work"):
+            merge(args)
+        return
+
+    if args.resume or args.follow:
+        with parser.timings("work"):
+            resume(args, errors)
+        return
+
+    if args.shard and len(args.infiles) > 1:
+        from . import split
+
+        args.infiles = split.partition(args.infiles, *args.shard)
+        log.debug("Shard %d/%d: %s", *args.shard, args.infiles)
+        # Done, so a shard of a single INPUT_FILE is not split again by records()
+        args.shard = None
+
+    if args.where or args.aggregate:
+        with parser.timings("work"):
+            tables(args)
+        return
+
+    if args.records or args.shard:
+        with parser.timings("work"):
+            records(args, errors)
+        return
+
+    worker: t.Callable[[t.Any], str] = functools.partial(process, use_mmap=args.mmap)
+    if args.prefetch:
+        worker = process_data
+    if errors is not None:
+        worker = functools.partial(u.returning_errors, worker)
+    prefetcher = u.Prefetcher(workers=args.prefetch) if args.prefetch else None
+
+    def mapper(paths: t.Iterable[str]) -> t.Iterator[str]:
+        items = paths if prefetcher is None else prefetcher.read(paths)
+        return u.parallel_map(worker, items, jobs=args.jobs)
+
+    cache = None
+    if args.cache:
+        # Everything results depend on, besides the input itself
+        salt = (__version__, args.option, args.argument, args.mmap)
+        cache = u.ResultCache(args.cache_dir, salt=salt)
     try:
-        cli(argv)
+        with parser.timings("work"), u.openstd(
+            "-", "wb", compression=args.compress
+        ) as stdout, u.Serializer(stdout, args.output_format) as out:
+            results = mapper(args.infiles) if cache is None else cache.map(mapper, args.infiles)
+            write_results(results, out, errors)
+    finally:
+        if cache is not None:
+            cache.close()
+    if prefetcher is not None and args.timings:
+        prefetcher.report()
+
+
+def batch(args: argparse.Namespace) -> tuple[int, int]:
+    """Batch path of cli(), running execute() for each MANIFEST line
+
+    Return the number of failed items and of all items.
+    """
+    import json
+    import shlex
+
+    entries: list[tuple[int, list[str]]] = []  # (line number, argv)
+    with u.openstd(args.batch, "r") as fh:
+        for number, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                if line.startswith("["):
+                    argv = json.loads(line)
+                    if not all(isinstance(_, str) for _ in argv):
+                        raise ValueError("not an array of strings")
+                else:
+                    argv = shlex.split(line)
+            except ValueError as e:
+                raise u.ProjectError("Invalid line %d in %s: %s", number, args.batch, e)
+            entries.append((number, argv))
+
+    failed = 0
+    statuses = u.parallel_map(batch_item, (_[1] for _ in entries), jobs=args.jobs)
+    for (number, argv), status in zip(entries, statuses):
+        if status:
+            failed += 1
+            command = " ".join(shlex.quote(_) for _ in argv)
+            log.warning("Line %d exited with status %d: %s", number, status, command)
+    log.debug("Batch: %d items, %d failed", len(entries), failed)
+    return failed, len(entries)
+
+
+def batch_item(argv: list[str]) -> int:
+    """execute() for a --batch item, restoring the logging level it may set"""
+    level = log.root.level
+    try:
+        return execute(argv, item=True)
+    finally:
+        log.root.setLevel(level)
+
+
+def process(path: str, use_mmap: bool = False) -> str:
+    """Process a single input file. Must be picklable, as it may run in a worker"""
+    from . import module
+
+    with u.openmap(path) if use_mmap else u.openstd(path, "rb") as fd:
+        # mmap has no name, so name it as openstd() names files
+        return module.function(fd, getattr(fd, "name", "<stdin>" if path == "-" else path))
+
+
+def process_data(item: tuple[str, bytes | Exception]) -> str:
+    """process() counterpart for a file read ahead by --prefetch"""
+    import io
+
+    from . import module
+
+    path, data = item
+    if isinstance(data, Exception):
+        raise data
+    return module.function(io.BytesIO(data), "<stdin>" if path == "-" else path)
+
+
+def write_results(
+    results: t.Iterable[t.Any],
+    out: u.Serializer,
+    errors: u.ErrorLog | None = None,
+    start: int = 0,
+) -> None:
+    """Write results to out, adding the errors among them to errors
+
+    Errors are returned as results by util.returning_errors(), only used with
+    --keep-going, and their offset is the index of the result, from start.
+    """
+    for index, result in enumerate(results, start):
+        if isinstance(result, Exception):
+            errors.add_error(result, index)  # type: ignore[union-attr]
+            continue
+        out.write(result)
+
+
+def records(args: argparse.Namespace, errors: u.ErrorLog | None = None) -> None:
+    """Records path of cli(), processing INPUT_FILEs record by record"""
+    from . import module, split
+
+    func: t.Callable[[bytes], t.Any] = module.process_record
+    if errors is not None:
+        func = functools.partial(u.returning_errors, func)
+    with u.openstd("-", "wb", compression=args.compress) as stdout, u.Serializer(
+        stdout, args.output_format
+    ) as out:
+        for path in args.infiles:
+            start, end = 0, None
+            if args.shard:  # a single INPUT_FILE, see cli()
+                part, parts = args.shard
+                start, end = split.record_ranges(path, parts)[part - 1]
+                log.debug("Shard %d/%d: %s bytes [%d, %d)", part, parts, path, start, end)
+            results = split.map_records(func, path, jobs=args.jobs, start=start, end=end)
+            write_results(results, out, errors)
+
+
+def tables(args: argparse.Namespace) -> None:
+    """Columnar path of cli(), filtering and aggregating numeric tables"""
+    from . import columnar
+
+    with u.openstd("-", "wb", compression=args.compress) as stdout, u.Serializer(
+        stdout, args.output_format
+    ) as out:
+        columnar.process(
+            args.infiles,
+            out,
+            delimiter=args.delimiter,
+            where=args.where or (),
+            aggregate=args.aggregate or (),
+            engine=args.engine,
+        )
+
+
+def merge(args: argparse.Namespace) -> None:
+    """Merge path of cli(), concatenating shard outputs"""
+    with u.openstd("-", "wb", compression=args.compress) as stdout:
+        for path in args.infiles:
+            with u.openstd(path, "rb") as fh:
+                u.copy_stream(fh, stdout)
+
+
+def resume(args: argparse.Namespace, errors: u.ErrorLog | None = None) -> None:
+    """Resume and follow path of cli(), processing only new records"""
+    from . import module, tail
+
+    checkpoints = tail.Checkpoints(args.resume)
+    # Following writes each record as it comes
+    buffer_size = 0 if args.follow else 256 * 1024
+    # Checkpoints are saved only once the output is flushed, on leaving the with
+    # block, so records lost to a failed write, such as a closed pipe, are
+    # processed again by the next run.
+    try:
+        with u.openstd("-", "wb", compression=args.compress) as stdout, u.Serializer(
+            stdout, args.output_format, buffer_size=buffer_size
+        ) as out:
+            for path in args.infiles:
+                records = tail.read_new(path, checkpoints, follow=args.follow)
+                try:
+                    for number, record in enumerate(records):
+                        try:
+                            out.write(module.process_record(record))
+                        except u.ProjectError as err:
+                            if errors is None:
+                                raise
+                            errors.add_error(err, number)
+                finally:
+                    records.close()  # marks the checkpoint before it is saved
+    except KeyboardInterrupt:
+        # How following ends. A failed flush would have raised instead.
+        checkpoints.save()
+        raise
+    checkpoints.save()
+
+
+async def acli(args: argparse.Namespace, errors: u.ErrorLog | None = None) -> None:
+    """Async entry path of cli(), processing inputs concurrently, in order"""
+    import asyncio
+    import io
+
+    from . import module
+
+    limit = asyncio.Semaphore(args.jobs or len(args.infiles))
+
+    async def aprocess(path: str) -> t.Any:
+        async with limit:
+            try:
+                async with u.aopenstd(path, "rb") as fd:
+                    return await module.afunction(fd)
+            except (u.ProjectError, OSError) as err:
+                if errors is None:
+                    raise
+                return err
+
+    tasks = [asyncio.ensure_future(aprocess(_)) for _ in args.infiles]
+    # Serialized in memory, as Serializer writes synchronously, then written async
+    buffer = io.BytesIO()
+    out = u.Serializer(buffer, args.output_format, buffer_size=0)
+    async with u.aopenstd("-", "wb") as stdout:
+        try:
+            for index, task in enumerate(tasks):
+                write_results([await task], out, errors, index)
+                await stdout.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def execute(argv: list[str] | None = None, item: bool = False) -> int:
+    """Run cli(argv), handling its exceptions as run() does, and return the exit status
+
+    Used by run() and, with item, for each --batch item. KeyboardInterrupt and
+    BrokenPipeError are left to run().
+    """
+    status, reason = 2, "interrupted"  # unless changed below
+    try:
+        status, reason = (1, "errors") if cli(argv, item) else (0, "ok")
+    except SystemExit as e:  # such as from argparse
+        reason = "exit"
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BrokenPipeError:
+        reason = "pipe"
+        raise
     except u.ProjectError as err:
+        status, reason = 1, "error"
         log.critical(err)
-        sys.exit(1)
     except Exception as err:
+        status, reason = 1, "exception"
         log.exception(err)
-        sys.exit(1)
+    finally:
+        u.metrics.inc("exit_total", reason=reason)
+    return status
+
+
+def run(argv: list[str] | None = None) -> None:
+    """CLI entry point, handling exceptions from cli() and setting exit code"""
+    try:
+        status = execute(argv)
     except KeyboardInterrupt:
         log.info("Aborting")
-        sys.exit(2)  # signal.SIGINT.value, but not actually killed by SIGINT
+        status = 2  # signal.SIGINT.value, but not actually killed by SIGINT
+    except BrokenPipeError:
+        # stdout was closed by its reader, as by `| head`: stop, quietly
+        # https://docs.python.org/3/library/signal.html#note-on-sigpipe
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        status = 0
+    finally:
+        u.shutdown_logging()
+    if status:
+        sys.exit(status)
@@ -7,14 +7,31 @@ Module Description
 from __future__ import annotations
 
 import logging
-import typing_extensions as t
 
-from . import util as u
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import mmap
+
+    from . import util as u
+
+    import typing_extensions as t
 
 log: logging.Logger = logging.getLogger(__name__)
 
 
-def function(fd: t.BinaryIO) -> None:
-    """Docstring"""
-    u.printf("Path: %s", fd.name)
+def function(fd: t.Union[t.BinaryIO, mmap.mmap], name: str) -> str:
+    """Docstring. name is the file name, as mmap objects have none"""
+    ...
+    return "Path: %s" % name
+
+
+def process_record(data: t.Union[bytes, memoryview]) -> str:
+    """Record counterpart of function(), for a single line or other record"""
+    ...
+    return str(data, errors="replace")
+
+
+async def afunction(fd: u.AsyncFile) -> str:
+    """Async counterpart of function()"""
     ...
+    return "Path: %s" % fd.name
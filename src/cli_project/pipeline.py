@@ -0,0 +1,265 @@
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+"""
+Producer/consumer pipelines: source -> transform stages -> sink, with backpressure
+
+Stages are connected by bounded queues, and the number of items in flight is
+capped, so memory stays bounded however large the source is and however slow
+the sink is. Each stage runs its function in threads, for I/O-bound or
+GIL-releasing work, or in a process pool, for CPU-bound work.
+
+    pipe = Pipeline(Stage(parse, workers=4, processes=True), Stage(enrich, workers=8))
+    with u.openstd(path, "rb") as fd:
+        for result in pipe.run(bytes(_) for _ in u.iter_records(fd)):
+            ...
+    pipe.report()
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+
+from . import util as u
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import concurrent.futures
+
+    import typing_extensions as t
+
+log = u.get_logger(__name__)
+
+# Marks the end of the stream in queues
+_END = object()
+
+# Timeout, in seconds, for blocking queue operations to check for cancellation
+_POLL = 0.1
+
+
+class Stage:
+    """A transform step, applying func to each item with a number of workers
+
+    - processes -- Run func in a pool of `workers` processes instead of
+        threads. func, items and results must then be picklable.
+    - name -- For the report(). [Default: the name of func]
+
+    Counters are updated as items are processed: items, busy (total seconds
+    spent in func) and slowest (seconds of the slowest item).
+    """
+
+    def __init__(
+        self,
+        func: t.Callable[[t.Any], t.Any],
+        workers: int = 1,
+        processes: bool = False,
+        name: str = "",
+    ):
+        self.func = func
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.name = name or getattr(func, "__name__", repr(func))
+        self.items = 0
+        self.busy = 0.0
+        self.slowest = 0.0
+        self.lock = threading.Lock()
+
+    def count(self, elapsed: float) -> None:
+        with self.lock:
+            self.items += 1
+            self.busy += elapsed
+            if elapsed > self.slowest:
+                self.slowest = elapsed
+
+
+class Pipeline:
+    """Chain of stages, run over a source iterable by run()
+
+    - queue_size -- Capacity of each queue between stages.
+    - ordered -- Yield results in source order. If False, results are yielded
+        as soon as they are ready, which avoids waiting for slow items.
+    """
+
+    def __init__(self, *stages: Stage, queue_size: int = 64, ordered: bool = True):
+        if not stages:
+            raise ValueError("Pipeline requires at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.ordered = ordered
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._error: BaseException | None = None
+
+    def _put(self, q: queue.Queue[t.Any], item: object) -> bool:
+        """Blocking put, returning False if the pipeline was stopped meanwhile"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q: queue.Queue[t.Any]) -> t.Any:
+        """Blocking get, returning _END if the pipeline was stopped meanwhile"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _feed(
+        self, source: t.Iterable[t.Any], out: queue.Queue[t.Any], inflight: threading.Semaphore
+    ) -> None:
+        try:
+            for seq, item in enumerate(source):
+                while not inflight.acquire(timeout=_POLL):
+                    if self._stop.is_set():
+                        return
+                if not self._put(out, (seq, item)):
+                    return
+            self._put(out, _END)
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(
+        self,
+        stage: Stage,
+        inq: queue.Queue[t.Any],
+        out: queue.Queue[t.Any],
+        pool: concurrent.futures.Executor | None,
+        running: list[int],
+    ) -> None:
+        try:
+            while True:
+                task = self._get(inq)
+                if task is _END:
+                    self._put(inq, _END)  # for the sibling workers
+                    break
+                seq, item = task
+                start = time.perf_counter()
+                if pool is None:
+                    result = stage.func(item)
+                else:
+                    result = pool.submit(stage.func, item).result()
+                stage.count(time.perf_counter() - start)
+                if not self._put(out, (seq, result)):
+                    return
+        except BaseException as e:
+            self._fail(e)
+            return
+        with stage.lock:
+            running[0] -= 1
+            last = not running[0]
+        if last:
+            self._put(out, _END)
+
+    def run(self, source: t.Iterable[t.Any]) -> t.Iterator[t.Any]:
+        """Feed source through all stages, yielding the results
+
+        The first exception raised by the source or any stage stops the pipeline
+        and is re-raised here. So is KeyboardInterrupt, or closing the iterator.
+        """
+        import concurrent.futures
+
+        self._stop.clear()
+        self._error = None
+        queues: list[queue.Queue[t.Any]] = [
+            queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)
+        ]
+        capacity = self.queue_size * len(queues) + sum(_.workers for _ in self.stages)
+        inflight = threading.Semaphore(capacity)
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0], inflight))]
+        pools = []
+        for stage, inq, out in zip(self.stages, queues, queues[1:]):
+            pool = None
+            if stage.processes:
+                pool = concurrent.futures.ProcessPoolExecutor(
+                    stage.workers, initializer=u._init_worker
+                )
+                pools.append(pool)
+            running = [stage.workers]
+            threads.extend(
+                threading.Thread(target=self._work, args=(stage, inq, out, pool, running))
+                for _ in range(stage.workers)
+            )
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        pending: dict[int, t.Any] = {}  # out of order results
+        expected = 0
+        try:
+            while True:
+                task = self._get(queues[-1])
+                if task is _END:
+                    break
+                seq, result = task
+                if not self.ordered:
+                    inflight.release()
+                    yield result
+                    continue
+                pending[seq] = result
+                while expected in pending:
+                    inflight.release()
+                    yield pending.pop(expected)
+                    expected += 1
+            if self._error is not None:
+                raise self._error
+        finally:
+            self._stop.set()
+            # Not the feeder, which may be blocked on the source, such as stdin.
+            # It is a daemon, and stops at its next item.
+            for thread in threads[1:]:
+                thread.join()
+            for pool in pools:
+                pool.shutdown(wait=True)
+            self.elapsed += time.perf_counter() - start
+
+    def report(self) -> None:
+        """Log per-stage counters: items, throughput and latency"""
+        log.info(
+            "%-20s %8s %10s %10s %10s",
+            "stage",
+            "workers",
+            "items/s",
+            "avg [ms]",
+            "max [ms]",
+        )
+        for stage in self.stages:
+            log.info(
+                "%-20s %8d %10.1f %10.3f %10.3f",
+                stage.name,
+                stage.workers,
+                stage.items / self.elapsed if self.elapsed else 0,
+                1000 * stage.busy / stage.items if stage.items else 0,
+                1000 * stage.slowest,
+            )
+
+
+def run_records(
+    pipeline: Pipeline,
+    infile: u.PathLike | None = "-",
+    outfile: u.PathLike | None = "-",
+    sep: bytes = b"\n",
+) -> None:
+    """Run pipeline over sep-delimited records of infile, writing results to outfile
+
+    Both default to stdin/stdout, as openstd(). Stages get records as bytes,
+    without sep, and the last stage must return bytes, written each followed
+    by sep.
+    """
+    with u.openstd(infile, "rb") as fin, u.openstd(outfile, "wb") as fout:
+        source = (bytes(_) for _ in u.iter_records(fin, sep))
+        write = fout.write
+        for result in pipeline.run(source):
+            write(result)
+            write(sep)
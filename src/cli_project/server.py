@@ -0,0 +1,338 @@
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+"""
+Persistent server mode, saving interpreter startup and imports on each invocation
+
+The server listens on a local Unix socket and forks its warm process for each
+request, so every request runs in a pristine copy with its own stdio, working
+directory, exit status and Ctrl+C, in the style of chg. The client sends its
+argv, working directory and stdin/stdout/stderr file descriptors, forwards
+Ctrl+C to the request process and exits with its status. If no server is
+running, the client runs the command itself.
+
+The client side only imports builtin modules, so it starts as fast as Python
+itself does. POSIX only, as it requires fork() and file descriptor passing.
+"""
+from __future__ import annotations
+
+import array
+import os
+import socket
+import sys
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import typing_extensions as t
+
+# Environment variable with the socket path, overriding the default
+SOCKET_ENV = "PROJECT_SOCKET"
+
+HEADER_SIZE = 4  # of each int in the protocol, big-endian
+MAX_REQUEST = 1024 * 1024
+
+
+def socket_path() -> str:
+    """Socket path from $PROJECT_SOCKET, or in the user runtime or temp dir"""
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(directory, f"PROJECT-{os.getuid()}.sock")
+
+
+def _recv_exactly(conn: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        data += chunk
+    return data
+
+
+def _recv_int(conn: socket.socket) -> int:
+    return int.from_bytes(_recv_exactly(conn, HEADER_SIZE), "big")
+
+
+def _send_int(conn: socket.socket, value: int) -> None:
+    conn.sendall(value.to_bytes(HEADER_SIZE, "big"))
+
+
+def _exit_status(wstatus: int) -> int:
+    """Exit status from os.waitpid(), shell-like 128 + N if killed by signal N"""
+    if os.WIFSIGNALED(wstatus):
+        return 128 + os.WTERMSIG(wstatus)
+    return os.WEXITSTATUS(wstatus)
+
+
+# -----------------------------------------------------------------------------
+# Client
+
+
+def _trusted(conn: socket.socket, path: str) -> bool:
+    """True if the server on conn, connected to path, is run by this user
+
+    The socket file must be owned by this user and private, as serve() creates
+    it. Where available, such as on Linux, the peer credentials must match too.
+    """
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        return False
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:
+        return True
+    creds = array.array("i")  # struct ucred: pid, uid, gid
+    creds.frombytes(conn.getsockopt(socket.SOL_SOCKET, option, 3 * creds.itemsize))
+    return creds[1] == os.getuid()
+
+
+def client(argv: list[str] | None = None, path: str | None = None) -> int:
+    """Run a command in the server, or in this process if there is no server
+
+    Console script entry point. Returns the command exit status.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    path = path or socket_path()
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        # Our stdio is only for our own server, not for whoever took the path
+        if not _trusted(conn, path):
+            print(f"Ignoring server socket {path}: not private to this user", file=sys.stderr)
+            raise ConnectionRefusedError
+    except OSError:
+        conn.close()
+        from . import main
+
+        main.run(argv)
+        return 0
+
+    with conn:
+        payload = b"\0".join(os.fsencode(_) for _ in [os.getcwd(), *argv])
+        fds = array.array("i", [0, 1, 2])
+        conn.sendmsg(
+            [len(payload).to_bytes(HEADER_SIZE, "big"), payload],
+            [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds.tobytes())],
+        )
+        pid = _recv_int(conn)
+        while True:
+            try:
+                return _recv_int(conn)
+            except KeyboardInterrupt:
+                os.kill(pid, 2)  # signal.SIGINT, without importing signal
+
+
+# -----------------------------------------------------------------------------
+# Server
+
+
+def _recv_request(conn: socket.socket) -> tuple[list[int], str, list[str]]:
+    """Return the (fds, cwd, argv) of a client request"""
+    fds = array.array("i")
+    msg, ancdata, flags, _ = conn.recvmsg(HEADER_SIZE, socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[: len(data) - (len(data) % fds.itemsize)])
+    try:
+        if len(fds) != 3 or flags & socket.MSG_CTRUNC:
+            raise ConnectionError("Invalid request: expected 3 file descriptors")
+        size = int.from_bytes(msg + _recv_exactly(conn, HEADER_SIZE - len(msg)), "big")
+        if size > MAX_REQUEST:
+            raise ConnectionError(f"Invalid request: too large, {size} bytes")
+        cwd, *argv = (os.fsdecode(_) for _ in _recv_exactly(conn, size).split(b"\0"))
+    except Exception:
+        for fd in fds:
+            os.close(fd)
+        raise
+    return list(fds), cwd, argv
+
+
+def _run_child(
+    handler: t.Callable[[list[str]], object], fds: list[int], cwd: str, argv: list[str]
+) -> t.NoReturn:
+    """Run a request in the forked child process, never returning"""
+    import atexit
+    import signal
+
+    status = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(cwd)
+        from . import util as u
+
+        u.reset_logging()
+        # Exit functions registered by the server are not for the request to run.
+        # Private, but the only way to run the request ones on os._exit()
+        atexit._clear()
+        try:
+            handler(argv)
+            status = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+        atexit._run_exitfuncs()
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(status)
+
+
+def serve(
+    handler: t.Callable[[list[str]], object], path: str | None = None, jobs: int = 0
+) -> None:
+    """
+    Serve client requests, running handler(argv) in a forked process for each
+
+    - jobs -- Maximum number of concurrent requests. If 0, use all CPUs.
+
+    Each request process exits with the status of handler, 0 if it returns or
+    the SystemExit code it raises, as main.run() does. Runs until interrupted
+    by Ctrl+C or SIGTERM, then waits for running requests.
+    """
+    import selectors
+    import signal
+
+    from . import util as u
+
+    log = u.get_logger(__name__)
+    if not hasattr(os, "fork"):
+        raise u.ProjectError("Server mode is not supported on this platform")
+
+    path = path or socket_path()
+    jobs = jobs or os.cpu_count() or 1
+    children: dict[int, socket.socket] = {}  # pid: client connection
+
+    # SIGCHLD wakes select() up via the wakeup fd, so children are reaped
+    # right away. The handler itself does nothing.
+    wakeup, wakeup_writer = socket.socketpair()
+    wakeup.setblocking(False)
+    wakeup_writer.setblocking(False)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    signal.set_wakeup_fd(wakeup_writer.fileno())
+    # Graceful shutdown on SIGTERM too, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # stale, from a server that did not exit cleanly
+        else:
+            raise u.ProjectError("Server already running on %s", path)
+        finally:
+            probe.close()
+    old_umask = os.umask(0o177)  # socket accessible by the user only
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(old_umask)
+    listener.listen(jobs)
+
+    selector = selectors.DefaultSelector()
+    selector.register(wakeup, selectors.EVENT_READ)
+    selector.register(listener, selectors.EVENT_READ)
+    accepting = True
+    log.info("Serving on %s with up to %d concurrent requests", path, jobs)
+
+    def reap() -> None:
+        while children:
+            try:
+                pid, wstatus = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            status = _exit_status(wstatus)
+            conn = children.pop(pid)
+            log.debug("Request %d exited with status %d", pid, status)
+            try:
+                _send_int(conn, status)
+            except OSError:
+                pass  # client is gone
+            conn.close()
+
+    def accept() -> None:
+        conn, _ = listener.accept()
+        try:
+            conn.settimeout(5)
+            fds, cwd, argv = _recv_request(conn)
+        except (OSError, ValueError) as e:
+            log.warning("Discarding request: %s", e)
+            conn.close()
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            selector.close()
+            listener.close()
+            wakeup.close()
+            wakeup_writer.close()
+            conn.close()
+            for other in children.values():  # connections of other requests
+                other.close()
+            _run_child(handler, fds, cwd, argv)
+        for fd in fds:
+            os.close(fd)
+        log.debug("Request %d: %s", pid, argv)
+        children[pid] = conn
+        try:
+            _send_int(conn, pid)
+        except OSError:
+            pass
+
+    try:
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is wakeup:
+                    try:
+                        while wakeup.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.fileobj is listener:
+                    accept()
+            reap()
+            # Stop accepting when at capacity, so select() does not spin
+            if accepting and len(children) >= jobs:
+                selector.unregister(listener)
+                accepting = False
+            elif not accepting and len(children) < jobs:
+                selector.register(listener, selectors.EVENT_READ)
+                accepting = True
+    finally:
+        log.info("Shutting down, waiting for %d request(s)", len(children))
+        listener.close()
+        os.unlink(path)
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for pid, conn in children.items():
+            try:
+                _, wstatus = os.waitpid(pid, 0)
+                _send_int(conn, _exit_status(wstatus))
+            except OSError:
+                pass
+            conn.close()
+        selector.close()
+        wakeup.close()
+        wakeup_writer.close()
+
+
+if __name__ == "__main__":
+    sys.exit(client())
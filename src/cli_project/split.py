@@ -0,0 +1,173 @@
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+"""
+Splitting inputs into shards: contiguous runs of items, or byte ranges of a
+single file aligned to record boundaries
+
+Splits are deterministic, depending only on the inputs and the number of
+parts, so independent processes, possibly on different hosts, each taking
+part K of N cover the whole input exactly once. As parts are contiguous and
+in order, concatenating their outputs in part order gives the same output as
+a single run.
+"""
+from __future__ import annotations
+
+import os
+import stat
+
+from . import util as u
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import typing_extensions as t
+
+
+def partition(items: t.Sequence[u.T], part: int, parts: int) -> t.Sequence[u.T]:
+    """Return the part-th of parts contiguous, evenly sized slices of items
+
+    part is 1-based, as in --shard K/N.
+    """
+    if not 1 <= part <= parts:
+        raise ValueError(f"Invalid part {part} of {parts}")
+    size = len(items)
+    return items[size * (part - 1) // parts : size * part // parts]
+
+
+def splittable(path: u.PathLike) -> bool:
+    """True if path can be split by record_ranges(): a regular, uncompressed file"""
+    if not path or path == "-":
+        return False
+    try:
+        with open(path, "rb") as fh:
+            if not stat.S_ISREG(os.fstat(fh.fileno()).st_mode):
+                return False
+            head = fh.read(8)
+    except OSError:
+        return False
+    return not any(head.startswith(magic) for magic, _ in u.COMPRESSION.values())
+
+
+def record_ranges(
+    path: u.PathLike,
+    parts: int,
+    sep: bytes = b"\n",
+    start: int = 0,
+    end: int | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Split a regular file into parts (start, end) byte ranges, aligned to records
+
+    Ranges are about the same size, with each boundary moved forward to just
+    after a sep, so every range starts at a record. They cover the whole file,
+    or the [start, end) range of it, with no overlap, and some may be empty if
+    records are larger than a part. start must be at a record, such as the
+    start of a range returned before.
+
+    A sep that can overlap itself, such as b"||", is matched as iter_records()
+    does, scanning forward from the previous boundary, which reads the whole
+    range instead of only around the boundaries.
+    """
+    if not splittable(path):
+        raise u.ProjectError("Can not split %r, not a regular uncompressed file", path)
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return [(start, start)] * parts
+        import mmap
+
+        seplen = len(sep)
+        # Otherwise any match is one iter_records() finds, so the search may skip ahead
+        overlapping = any(sep[:_] == sep[-_:] for _ in range(1, seplen))
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = [start]
+            for part in range(1, parts):
+                target = start + (end - start) * part // parts
+                if target <= bounds[-1]:
+                    bounds.append(bounds[-1])  # previous record spans this part
+                    continue
+                # A sep ending at target or later, so target itself may be a bound
+                pos = mm.find(sep, bounds[-1] if overlapping else target - seplen, end)
+                while 0 <= pos and pos + seplen < target:
+                    pos = mm.find(sep, pos + seplen, end)
+                bounds.append(end if pos < 0 else pos + seplen)
+            bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def read_range(path: u.PathLike, start: int, end: int, sep: bytes = b"\n") -> t.Iterator[bytes]:
+    """Yield the records, without sep, of a byte range from record_ranges()
+
+    The file is memory-mapped, so only the pages of the range are read.
+    """
+    if start >= end:
+        return
+    import mmap
+
+    seplen = len(sep)
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        find = mm.find
+        pos = start
+        while pos < end:
+            stop = find(sep, pos, end)
+            if stop < 0:
+                yield mm[pos:end]
+                return
+            yield mm[pos:stop]
+            pos = stop + seplen
+
+
+def _map_range(
+    func: t.Callable[[bytes], u.R], path: u.PathLike, sep: bytes, bounds: tuple[int, int]
+) -> list[u.R]:
+    """map_records() worker, processing a whole range"""
+    return [func(_) for _ in read_range(path, *bounds, sep)]
+
+
+def map_records(
+    func: t.Callable[[bytes], u.R],
+    path: u.PathLike,
+    jobs: int = 0,
+    sep: bytes = b"\n",
+    start: int = 0,
+    end: int | None = None,
+    range_size: int = 64 * 1024 * 1024,
+) -> t.Iterator[u.R]:
+    """
+    Lazy map() of func over the records of a file, in parallel byte ranges
+
+    The file, or its [start, end) range, is split by record_ranges() into at
+    least 4 ranges per worker, and at most range_size bytes each, so workers
+    stay busy even if records are uneven, and memory for the results of a
+    range is bounded. Each worker maps its own ranges with read_range(), and
+    results are yielded in file order.
+
+    func must be picklable, as in util.parallel_map(), which is used with jobs.
+    If jobs is 1, or path can not be split, records are read sequentially,
+    decompressing if needed, and from stdin if path is "-". A range can only be
+    given for files that can be split.
+    """
+    import functools
+
+    if not splittable(path):
+        if start or end is not None:
+            raise u.ProjectError("Can not split %r, not a regular uncompressed file", path)
+        with u.openstd(path, "rb") as fh:
+            for record in u.iter_records(fh, sep):
+                yield func(bytes(record))
+        return
+
+    size = os.path.getsize(path)
+    end = size if end is None else min(end, size)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        yield from map(func, read_range(path, start, end, sep))
+        return
+
+    length = end - start
+    parts = max(4 * jobs, -(-length // range_size))
+    ranges = record_ranges(path, parts, sep, start, end)
+    worker = functools.partial(_map_range, func, path, sep)
+    for results in u.parallel_map(worker, ranges, jobs=jobs):
+        yield from results
@@ -0,0 +1,213 @@
+# This file is part of [PROJECT_NAME], see <https://github.com/MestreLion/[PROJECT]>
+# Copyright (C) [YEAR] Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+# License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
+"""
+Incremental reading of append-only files, such as logs: resume and follow
+
+Checkpoints keep, for each file, the offset after its last complete record,
+its inode and a hash of the data right before that offset. On the next run
+only records appended since then are read. A file whose inode changed was
+rotated, and one that shrank or whose hashed data changed was truncated or
+rewritten: both are read again from the start.
+
+In follow mode, like `tail -F`, new records are read as they are appended,
+waiting with inotify on Linux, or polling elsewhere, and following the path
+across rotations.
+"""
+from __future__ import annotations
+
+import os
+import time
+
+from . import util as u
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import typing_extensions as t
+
+log = u.get_logger(__name__)
+
+# Bytes before the checkpoint offset that are hashed to detect rewrites
+HASH_SIZE = 4096
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+
+def _digest(fd: int, offset: int) -> str:
+    import hashlib
+
+    start = max(0, offset - HASH_SIZE)
+    return hashlib.blake2b(os.pread(fd, offset - start, start), digest_size=16).hexdigest()
+
+
+class Checkpoints:
+    """Per-file checkpoints, saved as JSON to path, or in memory only if None
+
+    Saving is atomic, so an interrupted run leaves the previous checkpoints.
+    """
+
+    def __init__(self, path: u.PathLike | None = None):
+        self.path = path
+        self.data: dict[str, dict[str, t.Any]] = {}
+        if path is None:
+            return
+        import json
+
+        try:
+            with open(path) as fh:
+                self.data = json.load(fh)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            raise u.ProjectError("Invalid checkpoint file %r: %s", path, e)
+
+    def resume(self, path: str, fd: int) -> int:
+        """Return the offset to resume reading path from, opened as fd"""
+        checkpoint = self.data.get(os.path.abspath(path))
+        if not checkpoint:
+            return 0
+        st = os.fstat(fd)
+        offset: int = checkpoint["offset"]
+        if (st.st_ino, st.st_dev) != (checkpoint["inode"], checkpoint["device"]):
+            log.info("%s was rotated, reading from start", path)
+            return 0
+        if st.st_size < offset or _digest(fd, offset) != checkpoint["digest"]:
+            log.info("%s was truncated or rewritten, reading from start", path)
+            return 0
+        return offset
+
+    def mark(self, path: str, fd: int, offset: int) -> None:
+        """Set the checkpoint of path, opened as fd, to offset"""
+        st = os.fstat(fd)
+        self.data[os.path.abspath(path)] = {
+            "offset": offset,
+            "inode": st.st_ino,
+            "device": st.st_dev,
+            "digest": _digest(fd, offset),
+        }
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        import json
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(os.fsdecode(self.path)))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with open(fd, "w") as fh:
+                json.dump(self.data, fh, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class _Watcher:
+    """Wait for changes to a file, with inotify if available, otherwise polling"""
+
+    def __init__(self, path: str, interval: float):
+        self.interval = interval
+        self.fd = -1
+        try:
+            import ctypes
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):  # not glibc/Linux
+            return
+        if fd < 0:
+            return
+        mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            os.close(fd)
+            return
+        self.fd = fd
+
+    def wait(self) -> None:
+        """Wait until the file changes, or at most interval seconds"""
+        if self.fd < 0:
+            time.sleep(self.interval)
+            return
+        import select
+
+        # Timeout is a safety net for changes inotify misses, such as on NFS
+        if select.select([self.fd], [], [], self.interval)[0]:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def _rotated(path: str, fd: int) -> bool:
+    """True if path is no longer the file opened as fd"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False  # moved away, the new one is not created yet
+    old = os.fstat(fd)
+    return (st.st_ino, st.st_dev) != (old.st_ino, old.st_dev)
+
+
+def read_new(
+    path: str,
+    checkpoints: Checkpoints,
+    sep: bytes = b"\n",
+    follow: bool = False,
+    interval: float = 1.0,
+) -> t.Generator[memoryview, None, None]:
+    """
+    Yield complete records appended to path since its checkpoint
+
+    Records are buffer views, as from util.iter_records(). The checkpoint is
+    marked after each batch of records and when the generator is closed,
+    covering the records consumed so far. A trailing record without sep is
+    left for the next run. Saving checkpoints is up to the caller.
+
+    - follow -- Keep waiting for new records, until interrupted, also across
+        rotations. Otherwise stop at the end of file.
+    - interval -- Polling interval for follow, in seconds, also used as the
+        maximum wait with inotify.
+    """
+    seplen = len(sep)
+    while True:
+        with open(path, "rb") as fh:
+            fd = fh.fileno()
+            offset = checkpoints.resume(path, fd)
+            watcher = _Watcher(path, interval) if follow else None
+            try:
+                while True:
+                    fh.seek(offset)
+                    for record in u.iter_records(fh, sep, partial=False):
+                        yield record
+                        offset += len(record) + seplen
+                    checkpoints.mark(path, fd, offset)
+                    if watcher is None:
+                        return
+                    if os.fstat(fd).st_size < offset:
+                        log.info("%s was truncated, reading from start", path)
+                        offset = 0
+                        continue
+                    if _rotated(path, fd):
+                        # Anything appended to the old file meanwhile
+                        fh.seek(offset)
+                        for record in u.iter_records(fh, sep):
+                            yield record
+                        log.info("%s was rotated, reopening", path)
+                        break
+                    watcher.wait()
+            finally:
+                checkpoints.mark(path, fd, offset)
+                if watcher is not None:
+                    watcher.close()
@@ -6,19 +6,87 @@ General utilities
 """
 from __future__ import annotations
 
+# Imports are kept to the bare minimum needed by ArgumentParser, as this module
+# is loaded even for --help and --version. Others are imported on demand.
 import argparse
 import contextlib
 import enum
-import logging
+import io
+import os
+import stat
 import sys
-import typing_extensions as t
+import time
+from _thread import allocate_lock
 
-if t.TYPE_CHECKING:
-    import os
+# Same as typing.TYPE_CHECKING, without importing typing at runtime
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import logging
+    import asyncio
+    import concurrent.futures
+    import logging.handlers
+    import mmap
+
+    import typing_extensions as t
 
     PathLike: t.TypeAlias = t.Union[str, bytes, os.PathLike]
 
-log: logging.Logger = logging.getLogger(__name__)
+    T = t.TypeVar("T")
+    R = t.TypeVar("R")
+    E = t.TypeVar("E", bound="ProjectError")
+
+    BinaryMode = t.Literal["rb", "wb", "ab", "xb", "r+b", "w+b", "a+b", "x+b"]
+
+# Same as logging.DEBUG, INFO, WARNING, ERROR and CRITICAL, without importing it
+DEBUG, INFO, WARNING, ERROR, CRITICAL = 10, 20, 30, 40, 50
+
+# Bounded size of the setup_logging() queue, and its listener
+LOG_QUEUE_SIZE = 10000
+_log_listener: logging.handlers.QueueListener | None = None
+
+# Default buffer size for chunked reads, large enough to amortize syscalls
+CHUNK_SIZE = 1024 * 1024
+# Default buffer size for binary writes by openstd()
+OUTPUT_BUFFER_SIZE = 4 * CHUNK_SIZE
+
+# Formats of Serializer, and the size of the length prefix of its binary frames
+OUTPUT_FORMATS = ("text", "jsonl", "csv", "binary")
+FRAME_HEADER_SIZE = 4
+
+# Compression formats handled by openstd(): name: (magic bytes, file extension)
+COMPRESSION = {
+    "gzip": (b"\x1f\x8b", ".gz"),
+    "bzip2": (b"BZh", ".bz2"),
+    "xz": (b"\xfd7zXZ\x00", ".xz"),
+    "zstd": (b"\x28\xb5\x2f\xfd", ".zst"),
+}
+
+
+class LazyLogger:
+    """Stand-in for logging.getLogger(name), only importing logging on first use
+
+    Callable attributes, such as debug() or isEnabledFor(), are cached on first
+    access, so later calls cost the same as on the actual Logger.
+    """
+
+    def __init__(self, name: str):
+        self._lazy_name = name
+
+    def __getattr__(self, attr: str) -> t.Any:
+        import logging
+
+        value = getattr(logging.getLogger(self._lazy_name), attr)
+        if callable(value):
+            setattr(self, attr, value)
+        return value
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Lazy logging.getLogger(), see LazyLogger"""
+    return LazyLogger(name)  # type: ignore  # duck-typed Logger
+
+
+log: logging.Logger = get_logger(__name__)
 
 
 # For ArgumentParser.epilog
@@ -28,34 +96,157 @@ License: GPLv3 or later, at your choice. See <http://www.gnu.org/licenses/gpl>
 """
 
 
+def _percent_format(args: tuple[object, ...]) -> str:
+    """Exception args as (msg, *args) to str(msg) % args, or just str(msg)"""
+    if len(args) > 1:
+        return str(args[0]) % args[1:]
+    return str(args[0]) if args else ""
+
+
 class ProjectError(Exception):
     """Base class for custom exceptions with a few extras on top of Exception.
 
-    - %-formatting for args, similar to logging.log()
+    - %-formatting for args, similar to logging.log(), done lazily by str()
+      so exceptions that are caught and never displayed cost no formatting
     - `errno` numeric attribute, similar to OSError
     - `e` attribute for the original exception, when re-raising exceptions
 
     All modules in this package raise this (or a subclass) for all explicitly
     raised, business-logic, expected or handled exceptions.
+
+    Attributes are slots, so raising one per record allocates no __dict__.
+    To not keep one per failure at all, see ErrorLog.
     """
 
+    __slots__ = ("errno", "e")
+
     def __init__(
         self, msg: object = "", *args: object, errno: int = 0, e: Exception | None = None
     ):
-        super().__init__((str(msg) % args) if args else msg)
+        super().__init__(msg, *args)
         self.errno: int = errno
         self.e: Exception | None = e
 
+    def __str__(self) -> str:
+        return _percent_format(self.args)
+
+    def __reduce__(self) -> tuple[t.Any, ...]:
+        # Slots are not pickled by BaseException, only its __dict__
+        state = dict(getattr(self, "__dict__", None) or {}, errno=self.errno, e=self.e)
+        return _rebuild, (type(self), self.args, state)
+
+
+def _rebuild(cls: type[E], args: tuple[object, ...], state: dict[str, t.Any]) -> E:
+    """Unpickle a ProjectError without calling __init__, as subclasses may have their own"""
+    err = cls.__new__(cls)
+    err.args = args
+    for name, value in state.items():
+        setattr(err, name, value)
+    return err
+
 
 class ProjectSimpleError(Exception):
-    """Base class for custom exceptions with %-formatting for args
+    """Base class for custom exceptions with lazy %-formatting for args
 
     All modules in this package raise this (or a subclass) for all explicitly
     raised, business-logic, expected or handled exceptions.
     """
 
+    __slots__ = ()
+
     def __init__(self, msg: object = "", *args: object):
-        super().__init__((str(msg) % args) if args else msg)
+        super().__init__(msg, *args)
+
+    def __str__(self) -> str:
+        return _percent_format(self.args)
+
+
+class ErrorLog:
+    """Compact accumulator of errors, to keep going instead of stopping at the first
+
+    Each error costs 16 bytes in arrays of errno codes, offsets and message
+    ids, with messages interned by their unformatted template. So millions of
+    failures, such as bad records, take a few MB and no exception objects.
+    Offset is whatever locates the failure: input index, record number or
+    byte offset, -1 if unknown.
+
+        errors = ErrorLog()
+        for i, record in enumerate(records):
+            try:
+                process(record)
+            except ProjectError as err:
+                errors.add_error(err, i)
+        errors.report()
+    """
+
+    __slots__ = ("errnos", "offsets", "message_ids", "messages", "_ids")
+
+    def __init__(self) -> None:
+        import array
+
+        self.errnos = array.array("i")
+        self.offsets = array.array("q")
+        self.message_ids = array.array("I")
+        self.messages: list[str] = []
+        self._ids: dict[str, int] = {}
+
+    def add(self, msg: object, errno: int = 0, offset: int = -1) -> None:
+        """Add an error by its message template, without creating an exception"""
+        key = str(msg)
+        mid = self._ids.get(key)
+        if mid is None:
+            mid = self._ids[key] = len(self.messages)
+            self.messages.append(key)
+        self.message_ids.append(mid)
+        self.errnos.append(errno)
+        self.offsets.append(offset)
+
+    def add_error(self, err: BaseException, offset: int = -1) -> None:
+        """Add an exception, interning its message template, such as ProjectError's"""
+        if isinstance(err, OSError) and err.strerror:
+            msg: object = err.strerror  # without the filename
+        else:
+            msg = err.args[0] if err.args else type(err).__name__
+        self.add(msg, getattr(err, "errno", None) or 0, offset)
+
+    def __len__(self) -> int:
+        return len(self.errnos)
+
+    def summary(self) -> list[tuple[str, int, int, int]]:
+        """(message, errno, count, first offset) of distinct errors, most frequent first"""
+        groups: dict[tuple[int, int], list[int]] = {}  # (mid, errno): [count, offset]
+        for mid, errno, offset in zip(self.message_ids, self.errnos, self.offsets):
+            group = groups.get((mid, errno))
+            if group is None:
+                groups[(mid, errno)] = [1, offset]
+            else:
+                group[0] += 1
+        rows = [(self.messages[k[0]], k[1], n, first) for k, (n, first) in groups.items()]
+        return sorted(rows, key=lambda _: -_[2])
+
+    def report(self, logger: logging.Logger | None = None, top: int = 10) -> None:
+        """Log a summary of the top distinct errors, if any, at ERROR level"""
+        if not self:
+            return
+        logger = logger or log
+        summary = self.summary()
+        logger.error("%d error(s), %d distinct:", len(self), len(summary))
+        for msg, errno, count, offset in summary[:top]:
+            logger.error("%8d x [errno %d] %s (first at %d)", count, errno, msg, offset)
+        if len(summary) > top:
+            logger.error("... and %d more distinct errors", len(summary) - top)
+
+
+def returning_errors(func: t.Callable[..., R], *args: t.Any, **kwargs: t.Any) -> t.Any:
+    """Call func, returning instead of raising any ProjectError or OSError
+
+    Module-level, so functools.partial(returning_errors, func) works with
+    parallel_map() and the error can be added to an ErrorLog by the parent.
+    """
+    try:
+        return func(*args, **kwargs)
+    except (ProjectError, OSError) as err:
+        return err
 
 
 class Enum(enum.Enum):
@@ -77,28 +268,439 @@ def printf(msg: object = "", *args: object) -> None:
     print((str(msg) % args) if args else msg)
 
 
+def _noop(*_args: object, **_kwargs: object) -> None:
+    pass
+
+
+class Printer:
+    """printf() for hot loops: level-gated, buffered, batching writes
+
+    Enabled if level >= threshold, checked only once at creation, so it can be
+    gated by the logging level: with threshold=args.loglevel and the default
+    level=INFO, output is disabled by -q. When disabled, printf() is a no-op
+    that does no formatting at all. To also skip evaluating its arguments,
+    guard calls with the enabled attribute.
+
+    Lines are joined and written in batches of about buffer_size characters,
+    or on every line if stream is a terminal. Use it as a context manager, or
+    call flush(), to write what is left.
+
+        with Printer(threshold=args.loglevel) as out:
+            for item in items:
+                out.printf("%s: %d", item.name, item.value)
+    """
+
+    def __init__(
+        self,
+        level: int = INFO,
+        threshold: int = INFO,
+        stream: t.TextIO | None = None,
+        buffer_size: int = 64 * 1024,
+    ):
+        self.enabled: bool = level >= threshold
+        self.stream: t.TextIO = stream or sys.stdout
+        self.buffer_size: int = 0 if self.stream.isatty() else buffer_size
+        self.buffer: list[str] = []
+        self.size: int = 0
+        if not self.enabled:
+            self.printf = _noop  # type: ignore[method-assign]
+
+    def printf(self, msg: object = "", *args: object) -> None:
+        line = (str(msg) % args) if args else str(msg)
+        self.buffer.append(line)
+        self.size += len(line) + 1
+        if self.size > self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.buffer.append("")  # for the trailing newline
+            self.stream.write("\n".join(self.buffer))
+            self.buffer.clear()
+            self.size = 0
+        self.stream.flush()
+
+    def __enter__(self) -> Printer:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.flush()
+
+
+class LogGate:
+    """Snapshot of logger.isEnabledFor() for the standard levels, as attributes
+
+    Checking an attribute is several times cheaper than logging a disabled
+    message, and guarding with it skips evaluating the arguments as well:
+
+        gate = LogGate(log)
+        for line in fd:
+            if gate.info:
+                log.info(line.strip())
+
+    Call refresh() after changing the logging configuration.
+    """
+
+    __slots__ = ("logger", "debug", "info", "warning", "error", "critical")
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.refresh()
+
+    def refresh(self) -> None:
+        enabled = self.logger.isEnabledFor
+        self.debug: bool = enabled(DEBUG)
+        self.info: bool = enabled(INFO)
+        self.warning: bool = enabled(WARNING)
+        self.error: bool = enabled(ERROR)
+        self.critical: bool = enabled(CRITICAL)
+
+
 def setup_logging(
-    level: int = logging.INFO,
+    level: int = INFO,
     fmt: str = "[%(asctime)s %(levelname)-6.6s] %(module)-4s: %(message)s",
     datefmt: str = "%Y-%m-%d %H:%M:%S",
     style: t.Literal["%", "{", "$"] = "%",
+    queue: t.Literal["block", "drop"] | None = None,
+    queue_size: int = LOG_QUEUE_SIZE,
 ) -> None:
+    """
+    Configure root logger to stderr, INFO messages without level and timestamp
+
+    If queue is set, records are handed over to a bounded queue and written by a
+    background thread in batches, so a slow stderr consumer does not block the
+    caller. When the queue is full, "block" waits for room and "drop" discards
+    the record, counting it. Call shutdown_logging() to flush it on exit.
+
+    Does nothing if the root logger already has handlers, as basicConfig().
+    """
+    import logging
+
+    if logging.getLogger().handlers:
+        return
+
     if level < logging.INFO:
-        logging.basicConfig(level=level, format=fmt, datefmt=datefmt, style=style)
+        formatter = logging.Formatter(fmt=fmt, datefmt=datefmt, style=style)
+    else:
+        # Adapted from https://stackoverflow.com/a/25101727/624066
+        class PlainInfo(logging.Formatter):
+            info_formatter = logging.Formatter(style=style)
+
+            def format(self, record: logging.LogRecord) -> str:
+                if record.levelno == logging.INFO:
+                    return self.info_formatter.format(record)
+                return super().format(record)
+
+        formatter = PlainInfo(fmt=fmt, datefmt=datefmt, style=style)
+
+    if not queue:
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+        logging.basicConfig(level=level, handlers=[handler])
+        return
+
+    import logging.handlers
+    from queue import Full, Queue
+
+    class QueueHandler(logging.handlers.QueueHandler):
+        dropped = 0
+
+        def __init__(self, records: Queue[t.Any]):
+            super().__init__(records)
+            self.records = records  # self.queue is typed as any queue-like object
+
+        def enqueue(self, record: logging.LogRecord) -> None:
+            if queue == "block":
+                self.records.put(record)
+                return
+            try:
+                self.records.put_nowait(record)
+            except Full:
+                self.dropped += 1
+
+    class BatchHandler(logging.StreamHandler):  # type: ignore[type-arg]
+        """Join records in a single write(), flushed when the queue runs empty"""
+
+        def __init__(self, queue: Queue[t.Any], batch: int = 256):
+            super().__init__()
+            self.queue = queue
+            self.batch = batch
+            self.buffer: list[str] = []
+
+        def emit(self, record: logging.LogRecord) -> None:
+            try:
+                self.buffer.append(self.format(record) + self.terminator)
+                if len(self.buffer) >= self.batch or self.queue.empty():
+                    self.flush()
+            except Exception:
+                self.handleError(record)
+
+        def flush(self) -> None:
+            with self.lock:  # type: ignore[union-attr]  # created in __init__
+                if self.buffer:
+                    self.stream.write("".join(self.buffer))
+                    self.buffer.clear()
+                super().flush()
+
+    class QueueListener(logging.handlers.QueueListener):
+        def __init__(self, records: Queue[t.Any], *handlers: logging.Handler):
+            super().__init__(records, *handlers)
+            self.records = records
+
+        def enqueue_sentinel(self) -> None:
+            # The default put_nowait() may fail. _sentinel is None, but undeclared
+            self.records.put(getattr(self, "_sentinel", None))
+
+    global _log_listener
+    records: Queue[t.Any] = Queue(queue_size)
+    handler = BatchHandler(records)
+    handler.setFormatter(formatter)
+    listener = QueueListener(records, handler)
+    listener.queue_handler = QueueHandler(records)  # type: ignore[attr-defined]
+    # Message only, as prepare() merges it into record.msg before queueing
+    listener.queue_handler.setFormatter(logging.Formatter())  # type: ignore
+    logging.basicConfig(level=level, handlers=[listener.queue_handler])  # type: ignore
+    listener.start()
+    if _log_listener is None:
+        import atexit
+
+        atexit.register(shutdown_logging)
+    _log_listener = listener
+
+
+def shutdown_logging() -> None:
+    """Flush and stop the queue started by setup_logging(queue=...), if any
+
+    Logging then resumes synchronously on the same handler. Safe to call more
+    than once, also called at exit.
+    """
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener is None:
         return
+    listener.stop()
+    _unqueue_logging(listener)
+    dropped: int = listener.queue_handler.dropped  # type: ignore[attr-defined]
+    if dropped:
+        log.warning("Dropped %d log messages, queue was full", dropped)
+
+
+def reset_logging() -> None:
+    """Undo setup_logging() without flushing, such as in a forked child process
+
+    Any queue listener is detached but not stopped, as its thread does not
+    survive a fork.
+    """
+    import logging
+
+    global _log_listener
+    _log_listener = None
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+
+def _unqueue_logging(listener: logging.handlers.QueueListener) -> None:
+    """Replace the root queue handler with the listener's synchronous handler"""
+    import logging
+
+    root = logging.getLogger()
+    for handler in listener.handlers:
+        handler.flush()
+        root.addHandler(handler)
+    root.removeHandler(listener.queue_handler)  # type: ignore[attr-defined]
+
+
+class Timings:
+    """Accumulated wall and CPU time of named phases, thread-safe
+
+    Time each phase with the instance as a context manager, then report them:
+
+        timings = Timings()
+        with timings("parse"):
+            ...
+        timings.report()
+    """
+
+    def __init__(self) -> None:
+        self.start: float = time.perf_counter()
+        self.phases: dict[str, list[float]] = {}  # name: [wall, cpu, count]
+        self.lock = allocate_lock()  # cheaper to import than threading.Lock
+
+    @contextlib.contextmanager
+    def __call__(self, name: str) -> t.Generator[None, None, None]:
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self.lock:
+                phase = self.phases.setdefault(name, [0.0, 0.0, 0])
+                phase[0] += wall
+                phase[1] += cpu
+                phase[2] += 1
+
+    def report(self, stream: t.TextIO | None = None) -> None:
+        """Print a table of all phases, in milliseconds, to stream or stderr"""
+        lines = ["%-20s %10s %10s %6s" % ("phase", "wall [ms]", "cpu [ms]", "count")]
+        for name, (wall, cpu, count) in self.phases.items():
+            lines.append("%-20s %10.2f %10.2f %6d" % (name, 1000 * wall, 1000 * cpu, count))
+        total = 1000 * (time.perf_counter() - self.start)
+        lines.append("%-20s %10.2f %10.2f" % ("total", total, 1000 * time.process_time()))
+        print("\n".join(lines), file=stream or sys.stderr)
+
+
+class Metrics:
+    """Registry of counters, gauges and fixed-bucket histograms, labeled
+
+    Disabled until enable(), when every method returns right away. Hot paths
+    can skip even that call, and building labels, by checking enabled first.
+    Updates take no locks: concurrent increments of the same metric from
+    several threads may rarely be lost, which is accepted for the lower cost.
+    Only the current process is measured, not parallel_map() workers.
+
+    dump() writes JSON, or Prometheus text exposition format, for scraping.
+
+        metrics.inc("records_total", kind="bad")
+        with metrics.timer("request_seconds"):
+            ...
+    """
+
+    # Histogram bucket upper bounds, in seconds, plus +Inf
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+    def __init__(self, prefix: str = "project_"):
+        self.enabled = False
+        self.prefix = prefix
+        self.counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        self.gauges: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        # (name, labels): [count per bucket..., count in +Inf, sum]
+        self.histograms: dict[tuple[str, tuple[tuple[str, str], ...]], list[float]] = {}
 
-    # Adapted from https://stackoverflow.com/a/25101727/624066
-    class PlainInfo(logging.Formatter):
-        info_formatter = logging.Formatter(style=style)
+    def enable(self) -> None:
+        self.enabled = True
 
-        def format(self, record: logging.LogRecord) -> str:
-            if record.levelno == logging.INFO:
-                return self.info_formatter.format(record)
-            return super().format(record)
+    def inc(self, name: str, value: float = 1, **labels: object) -> None:
+        """Add value to a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
 
-    handler = logging.StreamHandler()
-    handler.setFormatter(PlainInfo(fmt=fmt, datefmt=datefmt, style=style))
-    logging.basicConfig(level=level, handlers=[handler])
+    def set(self, name: str, value: float, **labels: object) -> None:
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        self.gauges[(name, tuple(sorted((k, str(v)) for k, v in labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        """Add a value, usually in seconds, to a histogram"""
+        if not self.enabled:
+            return
+        from bisect import bisect_left
+
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        counts = self.histograms.get(key)
+        if counts is None:
+            counts = self.histograms[key] = [0] * (len(self.BUCKETS) + 2)
+        counts[bisect_left(self.BUCKETS, value)] += 1
+        counts[-1] += value
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: object) -> t.Generator[None, None, None]:
+        """Context observing its wall time in a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def as_dict(self) -> dict[str, list[dict[str, t.Any]]]:
+        """All metrics, JSON-serializable"""
+        data: dict[str, list[dict[str, t.Any]]] = {
+            "counters": [],
+            "gauges": [],
+            "histograms": [],
+        }
+        for kind in ("counters", "gauges"):
+            for (name, labels), value in getattr(self, kind).items():
+                data[kind].append({"name": name, "labels": dict(labels), "value": value})
+        for (name, labels), counts in self.histograms.items():
+            bounds = [*self.BUCKETS, "+Inf"]
+            data["histograms"].append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "buckets": dict(zip(map(str, bounds), counts)),
+                    "count": sum(counts[:-1]),
+                    "sum": counts[-1],
+                }
+            )
+        return data
+
+    def prometheus(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+
+        def fmt(labels: t.Iterable[tuple[str, str]]) -> str:
+            pairs = ",".join(
+                '%s="%s"'
+                % (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for k, v in labels
+            )
+            return "{%s}" % pairs if pairs else ""
+
+        lines = []
+        typed = set()
+        for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            for (name, labels), value in sorted(metrics.items()):
+                name = self.prefix + name
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{fmt(labels)} {value!r}")
+        for (name, labels), counts in sorted(self.histograms.items()):
+            name = self.prefix + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip([*map(repr, self.BUCKETS), "+Inf"], counts):
+                cumulative += int(count)  # counts, but typed as the sum that ends them
+                lines.append(f"{name}_bucket{fmt(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {counts[-1]!r}")
+            lines.append(f"{name}_count{fmt(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: PathLike) -> None:
+        """Write all metrics to path: JSON if it ends in .json, else Prometheus text
+
+        Written atomically, so a scraper never sees a partial file. "-" is stderr.
+        """
+        json = os.fsdecode(path).endswith(".json")
+        if json:
+            import json as _json
+
+            text = _json.dumps(self.as_dict(), indent=1) + "\n"
+        else:
+            text = self.prometheus()
+        if path == "-":
+            sys.stderr.write(text)
+            return
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(os.fsdecode(path)))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with open(fd, "w") as fh:
+                fh.write(text)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+# The registry used by this package, enabled by --metrics-out
+metrics = Metrics()
 
 
 class ArgumentParser(argparse.ArgumentParser):
@@ -121,8 +723,20 @@ class ArgumentParser(argparse.ArgumentParser):
         attribute automatically created by parse_args() and set to True when
         the above loglevel is <logging.DEBUG> (i.e, when '-v|--verbose' is
         parsed). If empty, no such attribute is created. (default: "debug")
+    - logqueue_option -- dest of the pre-created --log-queue {block,drop}
+        option, to be used as setup_logging(queue=...). If empty, no such
+        option is created. (default: "log_queue")
+    - profiling_options -- create --profile[=FILE], --timings, --tracemalloc
+        and --metrics-out FILE options, started by parse_args() and reported
+        at exit.
+        Phases timed by --timings are parse_args() itself and any wrapped in
+        `with parser.timings("name"):`. (default: True)
+    - cache_options -- create --no-cache and --cache-dir DIR options, with
+        dests "cache" (bool) and "cache_dir", for use with ResultCache.
+        (default: False)
     - version
     Additions:
+    freeze() -- make parser read-only, for reuse across parse_args() calls.
     FileType -- convenience class attribute, an alias to argparse.FileType
     Please note some caveats in argparse.FileType:
     - Opens immediately on parse_args(), and never closes the file.
@@ -148,9 +762,15 @@ class ArgumentParser(argparse.ArgumentParser):
         multiline: bool = False,
         loglevel_options: str = "loglevel",
         debug_option: str = "debug",
+        logqueue_option: str = "log_queue",
+        profiling_options: bool = True,
+        cache_options: bool = False,
         version: str | None = None,
         **kwargs: t.Any,
     ):
+        self.timings = Timings()
+        self._frozen = False
+        self._profiling: set[str] = set()
         super().__init__(*args, **kwargs)
 
         if self.description is not None and not multiline:
@@ -165,6 +785,9 @@ class ArgumentParser(argparse.ArgumentParser):
 
         self.loglevel_options = loglevel_options
         self.debug_option = debug_option
+        self.logqueue_option = logqueue_option
+        self.profiling_options = profiling_options
+        self.cache_options = cache_options
 
         if self.loglevel_options:
             group = self.add_mutually_exclusive_group()
@@ -172,8 +795,8 @@ class ArgumentParser(argparse.ArgumentParser):
                 "-q",
                 "--quiet",
                 dest=self.loglevel_options,
-                const=logging.WARNING,
-                default=logging.INFO,
+                const=WARNING,
+                default=INFO,
                 action="store_const",
                 help="Suppress informative messages.",
             )
@@ -181,11 +804,68 @@ class ArgumentParser(argparse.ArgumentParser):
                 "-v",
                 "--verbose",
                 dest=self.loglevel_options,
-                const=logging.DEBUG,
+                const=DEBUG,
                 action="store_const",
                 help="Verbose mode, output extra info.",
             )
 
+        if self.logqueue_option:
+            self.add_argument(
+                "--log-queue",
+                dest=self.logqueue_option,
+                choices=("block", "drop"),
+                help="Write log messages from a background thread, so a slow stderr"
+                " does not slow down processing. When its queue is full, either"
+                " block or drop messages.",
+            )
+
+        if self.profiling_options:
+            group = self.add_argument_group("profiling options")
+            group.add_argument(
+                "--profile",
+                nargs="?",
+                const="-",
+                metavar="FILE",
+                help="Profile with cProfile, saving stats to FILE for pstats or,"
+                " if omitted, printing the top functions to stderr at exit."
+                " Use --profile=FILE to avoid ambiguity with positional arguments.",
+            )
+            group.add_argument(
+                "--timings",
+                default=False,
+                action="store_true",
+                help="Print wall and CPU time of each processing phase at exit.",
+            )
+            group.add_argument(
+                "--tracemalloc",
+                default=False,
+                action="store_true",
+                help="Trace memory allocations, printing the top sites at exit.",
+            )
+            group.add_argument(
+                "--metrics-out",
+                metavar="FILE",
+                help="Write run metrics to FILE at exit, such as I/O and phase times"
+                " and the exit reason: JSON if FILE ends in .json, otherwise"
+                " Prometheus text format. Use - for stderr.",
+            )
+
+        if self.cache_options:
+            group = self.add_argument_group("cache options")
+            group.add_argument(
+                "--no-cache",
+                dest="cache",
+                default=True,
+                action="store_false",
+                help="Do not use cached results, nor save new ones.",
+            )
+            group.add_argument(
+                "--cache-dir",
+                metavar="DIR",
+                help="Directory of cached results."
+                " [Default: PROJECT in $XDG_CACHE_HOME or ~/.cache]",
+            )
+
         if version:
             self.add_argument(
                 "-V",
@@ -198,47 +878,1406 @@ class ArgumentParser(argparse.ArgumentParser):
         self, *args: t.Any, **kwargs: t.Any
     ) -> argparse.Namespace:
         __doc__ = argparse.ArgumentParser.parse_args.__doc__
-        arguments: argparse.Namespace = super().parse_args(*args, **kwargs)
+        with self.timings("parse"):
+            arguments: argparse.Namespace = super().parse_args(*args, **kwargs)
         if self.debug_option and self.loglevel_options:
             setattr(
                 arguments,
                 self.debug_option,
-                getattr(arguments, self.loglevel_options) == logging.DEBUG,
+                getattr(arguments, self.loglevel_options) == DEBUG,
             )
+        if self.profiling_options:
+            self._start_profiling(arguments)
         return arguments
 
-    def error(self, message, argument:str=""):
+    def _start_profiling(self, arguments: argparse.Namespace) -> None:
+        """Start the requested profilers, registering their reports at exit
+
+        Each one is started only once, even if parse_args() is called again.
+        """
+        import atexit
+
+        def requested(option: str) -> bool:
+            if not getattr(arguments, option) or option in self._profiling:
+                return False
+            self._profiling.add(option)
+            return True
+
+        if requested("timings"):
+            atexit.register(self.timings.report)
+
+        if requested("metrics_out"):
+
+            def report_metrics(path: str = arguments.metrics_out) -> None:
+                for name, (wall, cpu, count) in self.timings.phases.items():
+                    metrics.set("phase_seconds", wall, phase=name)
+                    metrics.set("phase_cpu_seconds", cpu, phase=name)
+                    metrics.set("phase_calls", count, phase=name)
+                metrics.set("run_seconds", time.perf_counter() - self.timings.start)
+                metrics.set("run_cpu_seconds", time.process_time())
+                try:
+                    metrics.dump(path)
+                except OSError as e:
+                    log.error("Could not write metrics to %s: %s", path, e)
+
+            metrics.enable()
+            atexit.register(report_metrics)
+
+        if requested("tracemalloc"):
+            import tracemalloc
+
+            def report_tracemalloc(top: int = 10) -> None:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                lines = [f"Top {top} allocation sites:"]
+                lines.extend(str(_) for _ in snapshot.statistics("lineno")[:top])
+                print("\n".join(lines), file=sys.stderr)
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                atexit.register(report_tracemalloc)
+
+        if requested("profile"):
+            import cProfile
+
+            def report_profile(path: str = arguments.profile, top: int = 25) -> None:
+                profiler.disable()
+                if path != "-":
+                    profiler.dump_stats(path)
+                    return
+                import pstats
+
+                stats = pstats.Stats(profiler, stream=sys.stderr)
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is already active
+                return
+            atexit.register(report_profile)
+
+    def error(self, message: str, argument: str = "") -> t.NoReturn:
         if not argument:
             super().error(message)
-        for action in self._actions:
-            if argument in action.option_strings:
-                super().error(str(argparse.ArgumentError(action, message)))
-        raise AssertionError(f"No such command line option: {argument}")
+        action = self._option_string_actions.get(argument)
+        if action is None:
+            raise AssertionError(f"No such command line option: {argument}")
+        super().error(str(argparse.ArgumentError(action, message)))
+
+    def freeze(self) -> t.Self:
+        """
+        Make the parser read-only, so it can be built once and reused
+
+        Adding arguments, groups or defaults afterwards raises RuntimeError, and
+        option strings resolved by parse_args() are cached. A frozen parser can
+        be shared by threads, as parsing does not change it.
+        Arguments added to groups created before freezing are not detected.
+        Returns the parser itself, for convenience.
+        """
+        self._frozen = True
+        self._optional_cache: dict[str, t.Any] = {}
+        return self
+
+    def _check_frozen(self) -> None:
+        if self._frozen:
+            raise RuntimeError(f"Parser is frozen: {self.prog}")
+
+    def add_argument(self, *args: t.Any, **kwargs: t.Any) -> argparse.Action:
+        self._check_frozen()
+        return super().add_argument(*args, **kwargs)
+
+    def add_argument_group(self, *args: t.Any, **kwargs: t.Any) -> t.Any:
+        self._check_frozen()
+        return super().add_argument_group(*args, **kwargs)
+
+    def add_mutually_exclusive_group(self, **kwargs: t.Any) -> t.Any:
+        self._check_frozen()
+        return super().add_mutually_exclusive_group(**kwargs)
+
+    def set_defaults(self, **kwargs: t.Any) -> None:
+        self._check_frozen()
+        super().set_defaults(**kwargs)
+
+    def _parse_optional(self, arg_string: str) -> t.Any:
+        # Per-token fast path for frozen parsers: argparse resolves each option
+        # string again on every parse, including a linear scan of all options
+        # for abbreviations. Only option-like tokens are cached, and only up to
+        # a limit, as positional arguments such as paths are unbounded.
+        if not self._frozen or arg_string[:1] not in self.prefix_chars:
+            return super()._parse_optional(arg_string)
+        try:
+            return self._optional_cache[arg_string]
+        except KeyError:
+            pass
+        result = super()._parse_optional(arg_string)
+        if len(self._optional_cache) < 1024:
+            self._optional_cache[arg_string] = result
+        return result
+
+
+class ReadAhead(io.RawIOBase):
+    """Raw binary stream reading fh in a background thread, ahead of its consumer
+
+    Up to depth chunks of size bytes are read in advance, so slow producers
+    such as decompressors run concurrently with the code consuming their
+    output. Wrap it in io.BufferedReader() for read() and readline(). Closing
+    it also closes fh.
+    """
+
+    def __init__(self, fh: t.IO[bytes], name: str = "", size: int = CHUNK_SIZE, depth: int = 8):
+        import queue
+        import threading
+
+        super().__init__()
+        self.fh = fh
+        self.name = name
+        self._size = size
+        self._queue: queue.Queue[bytes | BaseException] = queue.Queue(depth)
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._closing = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self) -> None:
+        read, put = self.fh.read, self._queue.put
+        try:
+            while not self._closing:
+                chunk = read(self._size)
+                put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e:
+            put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: t.Any) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            chunk = self._queue.get()
+            if isinstance(chunk, BaseException):
+                self._eof = True
+                raise chunk
+            if not chunk:
+                self._eof = True
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            import queue
+
+            # Unblock the thread if the queue is full, so it sees _closing
+            self._closing = True
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.fh.close()
+        super().close()
+
+
+def _codec(fh: t.IO[bytes], compression: str, mode: str) -> t.BinaryIO:
+    """Return a compressor or decompressor file for fh, not closing it"""
+    if compression == "gzip":
+        import gzip
+
+        return gzip.GzipFile(fileobj=fh, mode=mode, compresslevel=6)  # type: ignore
+    if compression == "bzip2":
+        import bz2
+
+        return bz2.BZ2File(fh, mode)  # type: ignore
+    if compression == "xz":
+        import lzma
+
+        return lzma.LZMAFile(fh, mode)  # type: ignore
+    if compression == "zstd":
+        try:
+            from compression import zstd  # type: ignore  # Python 3.14+
+
+            return zstd.ZstdFile(fh, mode)  # type: ignore
+        except ImportError:
+            pass
+        try:
+            import zstandard  # type: ignore
+        except ImportError:
+            raise ProjectError("zstd requires Python 3.14+ or the zstandard package") from None
+        if "r" in mode:
+            return zstandard.ZstdDecompressor().stream_reader(  # type: ignore
+                fh, read_across_frames=True, closefd=False
+            )
+        return zstandard.ZstdCompressor().stream_writer(fh, closefd=False)  # type: ignore
+    # intentionally not using custom exception
+    raise ValueError(f"Invalid compression: {compression!r}")
+
+
+def _compressed(
+    fh: t.IO[t.Any], path: PathLike | None, mode: str, compression: str | None
+) -> t.IO[t.Any]:
+    """Return fh wrapped in a decompressor or compressor as requested, or fh itself"""
+    if compression == "none":
+        return fh
+    binary: t.IO[bytes] | None = fh if "b" in mode else getattr(fh, "buffer", None)
+    reading = "r" in mode
+    if binary is None or (reading and "+" in mode):
+        return fh
+    if compression is None:
+        if reading:
+            peek = getattr(binary, "peek", None)
+            if peek is None:
+                return fh
+            head = peek(6)  # does not consume, so stdin is fine too
+            found = (k for k, (magic, _) in COMPRESSION.items() if head.startswith(magic))
+        elif path and path != "-":
+            ext = os.path.splitext(os.fsdecode(path))[1]
+            found = (k for k, (_, extension) in COMPRESSION.items() if ext == extension)
+        else:
+            return fh
+        compression = next(found, None)
+        if compression is None:
+            return fh
+    if binary is not fh:
+        fh.flush()  # text already written, such as to sys.stdout
+    stream: t.IO[t.Any] = _codec(binary, compression, "rb" if reading else "wb")
+    if reading:
+        name = getattr(fh, "name", "")
+        stream = io.BufferedReader(ReadAhead(stream, name=name), CHUNK_SIZE)
+    if "b" not in mode:
+        # fh is a text file here, so it has these
+        encoding, errors = getattr(fh, "encoding"), getattr(fh, "errors")
+        stream = io.TextIOWrapper(stream, encoding=encoding, errors=errors)
+    return stream
+
+
+class _MeteredFile:
+    """File proxy counting bytes and calls of reads and writes, for metrics"""
+
+    __slots__ = ("fh", "ops", "size", "start")
+
+    def __init__(self, fh: t.IO[t.Any]):
+        self.fh = fh
+        self.ops = 0
+        self.size = 0
+        self.start = time.perf_counter()
+
+    def read(self, *args: t.Any) -> t.Any:
+        data = self.fh.read(*args)
+        self.ops += 1
+        self.size += len(data)
+        return data
+
+    def readinto(self, buffer: t.Any) -> int | None:
+        n = self.fh.readinto(buffer)  # type: ignore[attr-defined]
+        self.ops += 1
+        self.size += n or 0
+        return n  # type: ignore[no-any-return]
+
+    def readline(self, *args: t.Any) -> t.Any:
+        line = self.fh.readline(*args)
+        self.ops += 1
+        self.size += len(line)
+        return line
+
+    def write(self, data: t.Any) -> int:
+        n = self.fh.write(data)
+        self.ops += 1
+        self.size += n or 0
+        return n
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        for line in self.fh:
+            self.ops += 1
+            self.size += len(line)
+            yield line
+
+    def __getattr__(self, name: str) -> t.Any:
+        return getattr(self.fh, name)
+
+    def report(self, mode: str, stream: str) -> None:
+        metrics.inc("openstd_handles_total", mode=mode, stream=stream)
+        metrics.inc("openstd_ops_total", self.ops, mode=mode, stream=stream)
+        metrics.inc("openstd_bytes_total", self.size, mode=mode, stream=stream)
+        metrics.observe("openstd_handle_seconds", time.perf_counter() - self.start, mode=mode)
+
+
+if TYPE_CHECKING:
+
+    @t.overload
+    def openstd(
+        path: PathLike | None,
+        mode: BinaryMode,
+        compression: str | None = None,
+        buffer_size: int = OUTPUT_BUFFER_SIZE,
+    ) -> t.ContextManager[t.BinaryIO]: ...
+
+    @t.overload
+    def openstd(
+        path: PathLike | None = None,
+        mode: str = "r",
+        compression: str | None = None,
+        buffer_size: int = OUTPUT_BUFFER_SIZE,
+    ) -> t.ContextManager[t.IO[t.Any]]: ...
 
 
 @contextlib.contextmanager
 def openstd(
-    path: PathLike | None = None, mode: str = "r"
-) -> t.Generator[t.IO[t.Any], None, None]:
+    path: PathLike | None = None,
+    mode: str = "r",
+    compression: str | None = None,
+    buffer_size: int = OUTPUT_BUFFER_SIZE,
+) -> t.Generator[t.Any, None, None]:  # see the overloads above
     """
     Context wrapping open() to return stdin/stdout when path is "-"
 
     Wrapping behaves as argparse.FileType from Python 3.9, see its caveats in
     custom ArgumentParser above.
+
+    Compressed files are handled transparently, see COMPRESSION for formats:
+    - Reading detects the format by its magic bytes, also for stdin, and
+        decompresses in a background thread, reading ahead. The result is not
+        seekable.
+    - Writing compresses by path extension, or always for stdout if
+        compression is set.
+
+    - compression -- Format name to force, instead of detecting it, or "none"
+        to disable compression handling altogether.
+    - buffer_size -- Buffer for binary writes, 0 for the default buffering.
+        Binary stdout is then a TeeWriter, writing collected buffers with a
+        single os.writev() and no further copies.
     """
     if path and path != "-":
-        fh = open(path, mode)
+        writing = "b" in mode and "r" not in mode and buffer_size
+        fh = open(path, mode, buffering=buffer_size if writing else -1)
     else:
         # for the "type: ignore"s, see https://github.com/python/mypy/issues/15808
         if "r" in mode:
             fh = sys.stdin.buffer if "b" in mode else sys.stdin  # type: ignore
         elif any(c in mode for c in "wax"):
             fh = sys.stdout.buffer if "b" in mode else sys.stdout  # type: ignore
+            if "b" in mode and buffer_size:
+                try:
+                    fh = TeeWriter("-", buffer_size=buffer_size)  # type: ignore
+                except (AttributeError, OSError, ValueError):  # no fileno(), if replaced
+                    pass
         else:
             # intentionally not using custom exception
             raise ValueError(f"Tried to open '-' (stdin/stdout) with mode {mode!r}")
+    stream = fh
+    try:
+        stream = _compressed(fh, path, mode, compression)
+        if metrics.enabled:
+            stream = _MeteredFile(stream)  # type: ignore[assignment]
+        yield stream
+    finally:
+        if isinstance(stream, _MeteredFile):
+            std = "stdin" if fh in (sys.stdin, getattr(sys.stdin, "buffer", None)) else "stdout"
+            stream.report(
+                "read" if "r" in mode else "write", "file" if path and path != "-" else std
+            )
+            stream = stream.fh
+        try:
+            if stream is not fh:
+                stream.close()  # never closes fh itself
+        finally:
+            # Standard streams are left open, and closing stdin could also wait
+            # for a read blocked in another thread
+            streams = (sys.stdin, sys.stdout)
+            if fh not in streams and fh not in [getattr(_, "buffer", None) for _ in streams]:
+                fh.close()
+
+
+@contextlib.contextmanager
+def openmap(
+    path: PathLike | None = None,
+) -> t.Generator[t.Union[mmap.mmap, t.BinaryIO], None, None]:
+    """
+    Context returning a read-only mmap of path, or a binary file as fallback
+
+    Regular files, including stdin redirected from one, are mapped as a whole,
+    so random access and repeated scans cost no copies or read() syscalls.
+    Anything that can't be mapped, such as pipes, terminals and empty files,
+    falls back to the (buffered) binary file from openstd(path, "rb").
+
+    Both support read(), readline() and, if mapped, the buffer protocol and
+    slicing. Use isinstance(obj, mmap.mmap) to tell them apart.
+    """
+    import mmap
+
+    with openstd(path, "rb") as fh:
+        try:
+            st = os.fstat(fh.fileno())
+        except (OSError, ValueError):  # io.UnsupportedOperation is both
+            st = None
+        if st is not None and stat.S_ISREG(st.st_mode) and st.st_size > 0:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+        else:
+            yield fh
+
+
+class AsyncFile:
+    """Binary file with async read(), readline(), write() and line iteration
+
+    Returned by aopenstd(). Pipes, terminals and sockets use non-blocking
+    asyncio streams, anything else, such as regular files, blocking calls in
+    a thread.
+    """
+
+    def __init__(
+        self,
+        fh: t.IO[bytes],
+        name: str,
+        reader: asyncio.StreamReader | None = None,
+        writer: asyncio.StreamWriter | None = None,
+    ):
+        import asyncio
+
+        self.fh = fh
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+
+    def _offload(self, func: t.Callable[..., R], *args: t.Any) -> asyncio.Future[R]:
+        return self.loop.run_in_executor(None, func, *args)
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.reader is not None:
+            return await self.reader.read(size)
+        return await self._offload(self.fh.read, size)
+
+    async def readline(self) -> bytes:
+        if self.reader is not None:
+            return await self.reader.readline()
+        return await self._offload(self.fh.readline)
+
+    async def write(self, data: bytes) -> None:
+        if self.writer is not None:
+            self.writer.write(data)
+            await self.writer.drain()
+            return
+        await self._offload(self.fh.write, data)
+
+    def __aiter__(self) -> AsyncFile:
+        return self
+
+    async def __anext__(self) -> bytes:
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+
+@contextlib.asynccontextmanager
+async def aopenstd(
+    path: PathLike | None = None, mode: str = "rb"
+) -> t.AsyncGenerator[AsyncFile, None]:
+    """
+    Async counterpart of openstd(), for binary modes only
+
+    Reads from stdin or writes to stdout when path is "-", connected to the
+    running loop with connect_read_pipe() or connect_write_pipe() when they are
+    pipes, terminals or sockets. Regular files, including redirected stdin and
+    stdout, are read and written in a thread, as they can't be polled.
+    """
+    import asyncio
+
+    if "b" not in mode:
+        # intentionally not using custom exception
+        raise ValueError(f"Only binary modes are supported, not {mode!r}")
+    reading = "r" in mode
+    loop = asyncio.get_running_loop()
+    if path and path != "-":
+
+        def binary_open() -> t.IO[bytes]:
+            return open(path, mode)
+
+        fh = await loop.run_in_executor(None, binary_open)
+        try:
+            yield AsyncFile(fh, os.fsdecode(path))
+        finally:
+            await loop.run_in_executor(None, fh.close)
+        return
+
+    with openstd("-", mode) as std:
+        name = "<stdin>" if reading else "<stdout>"
+        if stat.S_ISREG(os.fstat(std.fileno()).st_mode):
+            yield AsyncFile(std, name)
+            return
+
+        # Transports take ownership of the file, and make its fd non-blocking,
+        # so connect a duplicate and restore blocking mode afterwards.
+        pipe = os.fdopen(os.dup(std.fileno()), mode, buffering=0)
+        reader = asyncio.StreamReader()
+        protocol = asyncio.StreamReaderProtocol(reader)
+        writer = None
+        transport: asyncio.BaseTransport
+        try:
+            try:
+                if reading:
+                    transport, _ = await loop.connect_read_pipe(lambda: protocol, pipe)
+                else:
+                    std.flush()
+                    write_transport, _ = await loop.connect_write_pipe(lambda: protocol, pipe)
+                    writer = asyncio.StreamWriter(write_transport, protocol, reader, loop)
+                    transport = write_transport
+            except BaseException:
+                pipe.close()
+                raise
+            try:
+                yield AsyncFile(std, name, reader=None if writer else reader, writer=writer)
+            finally:
+                if writer is None:
+                    transport.close()
+                else:
+                    writer.close()
+                    await writer.wait_closed()
+        finally:
+            os.set_blocking(std.fileno(), True)
+
+
+class TeeWriter:
+    """Binary writer fanning out the same data to several paths, "-" for stdout
+
+    Each buffer is written to all sinks with os.writev() on their raw file
+    descriptors, sharing the same memory, so there are no per-sink copies.
+    Small writes are collected up to buffer_size and written in a single
+    syscall per sink. Mutable buffers, such as the views from iter_chunks(),
+    are copied once if collected, large ones are written right away.
+
+    - hashes -- hashlib algorithm names to compute inline, see digests().
+    - append -- Append to files instead of truncating them.
+
+    Counters: size (total bytes written to each sink) and elapsed (seconds
+    spent writing and hashing), see also throughput.
+
+        with TeeWriter("-", "archive.bin", hashes=["sha256"]) as out:
+            for chunk in iter_chunks(fd):
+                out.write(chunk)
+        print(out.digests()["sha256"], out.throughput)
+    """
+
+    def __init__(
+        self,
+        *paths: PathLike,
+        hashes: t.Iterable[str] = (),
+        append: bool = False,
+        buffer_size: int = CHUNK_SIZE,
+    ):
+        import hashlib
+
+        self.paths = paths
+        self.buffer_size = buffer_size
+        self.hashes = {name: hashlib.new(name) for name in hashes}
+        self.size = 0
+        self.elapsed = 0.0
+        self._pending: list[bytes | memoryview] = []
+        self._pending_size = 0
+        self._iov_max = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+        self._fds: list[int] = []
+        self._owned: list[int] = []  # fds opened here, to be closed
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+        flags |= getattr(os, "O_BINARY", 0)
+        try:
+            for path in paths:
+                if path and path != "-":
+                    fd = os.open(path, flags, 0o666)
+                    self._owned.append(fd)
+                else:
+                    sys.stdout.flush()  # anything already printed goes first
+                    fd = sys.stdout.fileno()
+                self._fds.append(fd)
+        except BaseException:
+            self._close_fds()
+            raise
+
+    def write(self, data: t.Any) -> int:
+        """Write a bytes-like object to all sinks, return its size"""
+        size = len(data) if isinstance(data, bytes) else memoryview(data).nbytes
+        if size >= self.buffer_size:
+            self._pending.append(data)
+            self._pending_size += size
+            self.flush()
+            return size
+        # Keep a reference, or a copy if the caller may reuse it
+        self._pending.append(data if isinstance(data, bytes) else bytes(data))
+        self._pending_size += size
+        if self._pending_size >= self.buffer_size:
+            self.flush()
+        return size
+
+    def writelines(self, buffers: t.Iterable[t.Any]) -> None:
+        for data in buffers:
+            self.write(data)
+
+    def flush(self) -> None:
+        """Write all collected buffers to all sinks"""
+        if not self._pending:
+            return
+        start = time.perf_counter()
+        buffers, self._pending = self._pending, []
+        size, self._pending_size = self._pending_size, 0
+        for hashed in self.hashes.values():
+            for data in buffers:
+                hashed.update(data)
+        for fd in self._fds:
+            self._writev(fd, buffers)
+        self.size += size
+        self.elapsed += time.perf_counter() - start
+
+    def _writev(self, fd: int, buffers: list[bytes | memoryview]) -> None:
+        """os.writev() all buffers, handling partial writes and IOV_MAX"""
+        views = [memoryview(_).cast("B") for _ in buffers]
+        writev = getattr(os, "writev", None)
+        while views:
+            batch = views[: self._iov_max]
+            if writev is None:
+                written = os.write(fd, batch[0])
+            else:
+                written = writev(fd, batch)
+            # Drop what was written, slicing a partially written view
+            while views and written >= len(views[0]):
+                written -= len(views.pop(0))
+            if written:
+                views[0] = views[0][written:]
+
+    @property
+    def throughput(self) -> float:
+        """Write throughput, in bytes per second, counting each sink once"""
+        return self.size / self.elapsed if self.elapsed else 0.0
+
+    def fileno(self) -> int:
+        """The file descriptor of the only sink"""
+        if len(self._fds) != 1:
+            raise io.UnsupportedOperation("fileno() of a TeeWriter with several sinks")
+        return self._fds[0]
+
+    def isatty(self) -> bool:
+        return any(os.isatty(_) for _ in self._fds)
+
+    def writable(self) -> bool:
+        return True
+
+    def digests(self) -> dict[str, str]:
+        """Hex digests of all data written so far, by algorithm name"""
+        self.flush()
+        return {name: hashed.hexdigest() for name, hashed in self.hashes.items()}
+
+    def _close_fds(self) -> None:
+        for fd in self._owned:
+            os.close(fd)
+        self._owned.clear()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._close_fds()
+
+    def __enter__(self) -> TeeWriter:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+
+class Serializer:
+    """Buffered writer of records as text lines, JSON Lines, CSV or binary frames
+
+    Formats, see also OUTPUT_FORMATS:
+    - text -- str(record), bytes as-is, one per line.
+    - jsonl -- One compact JSON document per line. bytes are decoded as UTF-8.
+    - csv -- Sequences as rows, mappings as rows of their values with a header
+        from the keys of the first one, anything else as a single column.
+    - binary -- Length-prefixed frames: a 4-byte big-endian payload size, then
+        bytes as-is, str as UTF-8, anything else as JSON. See iter_frames().
+
+    Records are encoded into a preallocated buffer of buffer_size bytes, written
+    to the binary file fh only when full, or on each record if buffer_size is 0
+    or fh is a terminal. fh itself is only flushed by flush(), so it may gather
+    several buffers. Use it as a context manager, or call flush().
+
+        with openstd("-", "wb") as fh, Serializer(fh, "jsonl") as out:
+            for result in results:
+                out.write(result)
+    """
+
+    def __init__(self, fh: t.BinaryIO, fmt: str = "text", buffer_size: int = 256 * 1024):
+        if fmt not in OUTPUT_FORMATS:
+            # intentionally not using custom exception
+            raise ValueError(f"Invalid output format: {fmt!r}")
+        self.fh = fh
+        self.format = fmt
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.pos = 0
+        self.autoflush = not buffer_size or fh.isatty()
+        self.count = 0
+        self.write: t.Callable[[t.Any], None] = getattr(self, "_write_" + fmt)
+        if fmt == "jsonl" or fmt == "binary":
+            import json
+
+            self._dumps = json.JSONEncoder(
+                ensure_ascii=False, separators=(",", ":"), default=str
+            ).encode
+        if fmt == "csv":
+            import csv
+
+            self._csv = csv.writer(_Sink(self._put_text), lineterminator="\n")
+
+    def _put(self, data: bytes | bytearray | memoryview) -> None:
+        size = len(data)
+        if self.pos + size > len(self.buffer):
+            self._drain()
+            if size >= len(self.buffer):
+                self.fh.write(data)
+                return
+        self.view[self.pos : self.pos + size] = data
+        self.pos += size
+
+    def _put_text(self, text: str) -> None:
+        self._put(text.encode())
+
+    def _end(self) -> None:
+        self.count += 1
+        if self.autoflush:
+            self.flush()
+
+    def _write_text(self, record: t.Any) -> None:
+        if isinstance(record, (bytes, bytearray, memoryview)):
+            self._put(record)
+        else:
+            self._put(str(record).encode())
+        self._put(b"\n")
+        self._end()
+
+    def _write_jsonl(self, record: t.Any) -> None:
+        if isinstance(record, (bytes, bytearray, memoryview)):
+            record = str(record, errors="replace")
+        self._put(self._dumps(record).encode())
+        self._put(b"\n")
+        self._end()
+
+    def _write_csv(self, record: t.Any) -> None:
+        if isinstance(record, dict):
+            if not self.count:
+                self._csv.writerow(record.keys())
+            self._csv.writerow(record.values())
+        elif isinstance(record, (list, tuple)):
+            self._csv.writerow(record)
+        else:
+            self._csv.writerow((record,))
+        self._end()
+
+    def _write_binary(self, record: t.Any) -> None:
+        if isinstance(record, (bytes, bytearray, memoryview)):
+            payload = record
+        elif isinstance(record, str):
+            payload = record.encode()
+        else:
+            payload = self._dumps(record).encode()
+        size = len(payload)
+        if size >= 1 << (8 * FRAME_HEADER_SIZE):
+            raise ProjectError("Record too large for a binary frame: %d bytes", size)
+        self._put(size.to_bytes(FRAME_HEADER_SIZE, "big"))
+        self._put(payload)
+        self._end()
+
+    def _drain(self) -> None:
+        """Write the buffer to fh, without flushing it, so it can gather more"""
+        if self.pos:
+            # A copy fh can keep, as the buffer is reused, such as by TeeWriter
+            self.fh.write(bytes(self.view[: self.pos]))
+            self.pos = 0
+
+    def flush(self) -> None:
+        self._drain()
+        self.fh.flush()
+
+    def __enter__(self) -> Serializer:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.flush()
+
+
+class _Sink:
+    """Minimal text file for csv.writer(), passing writes to a callable"""
+
+    __slots__ = ("write",)
+
+    def __init__(self, write: t.Callable[[str], object]):
+        self.write = write
+
+
+def iter_frames(fh: t.BinaryIO) -> t.Iterator[bytes]:
+    """Yield the payloads of the binary frames written by Serializer(fmt="binary")"""
+    read = fh.read
+    while True:
+        header = read(FRAME_HEADER_SIZE)
+        if not header:
+            return
+        size = int.from_bytes(header, "big")
+        payload = read(size) if len(header) == FRAME_HEADER_SIZE else b""
+        if len(payload) < size or len(header) < FRAME_HEADER_SIZE:
+            raise ProjectError("Truncated binary frame in %s", getattr(fh, "name", "input"))
+        yield payload
+
+
+def iter_chunks(fh: t.BinaryIO, size: int = CHUNK_SIZE) -> t.Iterator[memoryview]:
+    """
+    Yield chunks of a binary file as views of a single, preallocated buffer
+
+    Reads with readinto(), so memory use is flat regardless of input size and no
+    new bytes objects are allocated per read. Chunks may be shorter than size,
+    for example on pipes, and the last one usually is.
+
+    The buffer is reused: each view is only valid until the next iteration.
+    Copy it with bytes(chunk) if it must outlive that.
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    readinto = fh.readinto  # type: ignore  # BinaryIO lacks readinto()
+    while True:
+        n = readinto(view)
+        if not n:
+            return
+        yield view[:n]
+
+
+def _plain_fd(fh: t.IO[t.Any] | TeeWriter) -> int:
+    """File descriptor of fh, flushed, if it is not wrapped or transformed, or -1"""
+    if isinstance(fh, TeeWriter):
+        if fh.hashes or len(fh._fds) != 1:
+            return -1
+    elif isinstance(fh, (io.BufferedReader, io.BufferedWriter)):
+        if not isinstance(fh.raw, io.FileIO):  # such as ReadAhead, decompressing
+            return -1
+    elif not isinstance(fh, io.FileIO):
+        return -1
+    if fh.writable():
+        fh.flush()
+    return fh.fileno()
+
+
+def _kernel_copy(infd: int, outfd: int, size: int) -> int | None:
+    """Copy infd to outfd with os.sendfile() or os.splice(), None if not possible"""
+    import errno
+
+    fds = (infd, outfd)
+    regular = stat.S_ISREG(os.fstat(infd).st_mode)
+    if regular and hasattr(os, "sendfile"):
+        offset = os.lseek(infd, 0, os.SEEK_CUR)
+
+        def call(copied: int) -> int:
+            return os.sendfile(outfd, infd, offset + copied, size)
+
+    elif hasattr(os, "splice") and any(stat.S_ISFIFO(os.fstat(_).st_mode) for _ in fds):
+        splice: t.Callable[[int, int, int], int] = getattr(os, "splice")  # Python 3.10+
+
+        def call(copied: int) -> int:
+            return splice(infd, outfd, size)
+
+    else:
+        return None
+    copied = 0
     try:
-        yield fh
+        while True:
+            n = call(copied)
+            if not n:
+                return copied
+            copied += n
+    except OSError as e:
+        unsupported = (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP)
+        if copied or e.errno not in unsupported:
+            raise
+        return None
     finally:
-        if fh is not sys.stdout:
-            fh.close()
+        if regular:
+            os.lseek(infd, offset + copied, os.SEEK_SET)
+
+
+def copy_stream(fin: t.BinaryIO, fout: t.BinaryIO, size: int = CHUNK_SIZE) -> int:
+    """
+    Copy all of binary file fin to fout, in the kernel if possible, return the size
+
+    If both are plain files, neither (de)compressed nor otherwise wrapped, the
+    data is copied by os.sendfile() from regular files, or os.splice() to or
+    from pipes on Linux, so it never reaches user space. Otherwise, or if the
+    kernel refuses to, chunks from iter_chunks() are written to fout.
+    """
+    copied = 0
+    if _plain_fd(fin) >= 0 and _plain_fd(fout) >= 0:
+        # Whatever fin has already buffered, such as after peek()
+        if hasattr(fin, "peek"):
+            copied += fout.write(fin.read(len(fin.peek(1))))
+        done = _kernel_copy(fin.fileno(), _plain_fd(fout), size)
+        if done is not None:
+            if isinstance(fout, TeeWriter):
+                fout.size += done
+            return copied + done
+    write = fout.write
+    for chunk in iter_chunks(fin, size):
+        copied += len(chunk)
+        write(chunk)
+    return copied
+
+
+def iter_records(
+    fh: t.BinaryIO, sep: bytes = b"\n", size: int = CHUNK_SIZE, partial: bool = True
+) -> t.Iterator[memoryview]:
+    """
+    Yield sep-delimited records of a binary file, without sep, as buffer views
+
+    Same reuse caveat as iter_chunks(): each view is only valid until the next
+    iteration. A trailing record without sep is also yielded, unless partial is
+    False, and records larger than size grow the buffer as needed.
+    """
+    readinto = getattr(fh, "readinto")  # BinaryIO lacks readinto()
+    first = None
+    if isinstance(fh, io.BufferedReader) and isinstance(fh.raw, io.FileIO):
+        # Take all that is buffered, such as by peek(), then read the raw file:
+        # it returns what a pipe has instead of waiting to fill buf, and holds
+        # no lock that closing fh, or exiting, would wait for if it blocks.
+        first = fh.read1(-1)
+        readinto = fh.raw.readinto
+    buf = bytearray(max(size, len(first or b"")))
+    view = memoryview(buf)
+    seplen = len(sep)
+    end = 0  # length of valid data in buf, including carried over partial record
+    while True:
+        if end == len(buf):
+            # A single record fills the whole buffer: grow it. The previous
+            # view is left for the garbage collector, as bytearray cannot be
+            # resized while any of its views are alive.
+            buf = buf + bytearray(len(buf))
+            view = memoryview(buf)
+        if first is None:
+            n = readinto(view[end:])
+        else:
+            n = len(first)
+            view[:n] = first
+            first = None
+        if not n:
+            if end and partial:
+                yield view[:end]
+            return
+        # Search starts at the new data, minus a possibly split separator
+        search = max(0, end - seplen + 1)
+        start = 0
+        end += n
+        while True:
+            pos = buf.find(sep, search, end)
+            if pos < 0:
+                break
+            yield view[start:pos]
+            start = search = pos + seplen
+        # Move the partial record to the front. Same-size slice assignment is
+        # allowed with exported views, and slicing buf (not view) copies.
+        if start:
+            end -= start
+            buf[:end] = buf[start : start + end]
+
+
+def _init_worker() -> None:
+    """Process pool initializer, leaving Ctrl+C and the logging queue to the parent"""
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # A forked worker inherits the queue, but not the thread writing it
+    global _log_listener
+    if _log_listener is not None:
+        _unqueue_logging(_log_listener)
+        _log_listener = None
+
+
+def parallel_map(
+    func: t.Callable[[T], R], iterable: t.Iterable[T], jobs: int = 0
+) -> t.Iterator[R]:
+    """
+    Lazy map() of func over iterable using a pool of jobs worker processes
+
+    Results are yielded in input order. Items are submitted in a bounded window,
+    so iterable can be arbitrarily large and is not consumed ahead of results.
+
+    - jobs -- Number of worker processes. If 0, use all CPUs. If 1, run
+        serially in the current process, skipping the pool and all pickling.
+
+    func, items and results must be picklable, so func must be a module-level
+    function (or a functools.partial of one). The first exception raised by func
+    is re-raised here, with its attributes such as ProjectError.errno preserved.
+    On any error, KeyboardInterrupt or close(), pending items are cancelled and
+    the pool waits only for the ones already running. Workers ignore SIGINT.
+    """
+    if jobs == 1:
+        yield from map(func, iterable)
+        return
+
+    import collections
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs or None, initializer=_init_worker
+    ) as executor:
+        window = 2 * executor._max_workers  # type: ignore  # undocumented attribute
+        pending: t.Deque[concurrent.futures.Future[R]] = collections.deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _fd_budget() -> int:
+    """How many more files this process should open at once, per RLIMIT_NOFILE"""
+    try:
+        import resource
+    except ImportError:  # not Unix
+        return 1024
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return 1024
+    try:
+        used = len(os.listdir("/proc/self/fd"))
+    except OSError:  # not Linux
+        used = 64
+    return max(1, (soft - used) // 2)  # leaving the rest for everything else
+
+
+class Prefetcher:
+    """
+    Read whole files ahead in a pool of threads, yielding (path, data) in order
+
+    For many small files on network or cold storage, the latency of opening
+    and reading each one dominates, not CPU. Files are read by openstd(), so
+    compressed ones are decompressed, up to depth files ahead of the consumer
+    and workers at once. Workers are capped so open files stay well below the
+    soft RLIMIT_NOFILE. Processing the data is up to the consumer, possibly
+    with parallel_map().
+
+    A file that can not be read yields its exception as data, so it does not
+    stop the others.
+
+    Counters, cumulative over read() calls, see also report(): files, size
+    (total bytes read), busy (total seconds spent opening and reading),
+    slowest (seconds of the slowest file), stalls (times the consumer waited
+    for a file), waited (total seconds of those waits), ready (sum of files
+    already read ahead at each yield, the queue depth) and peak (maximum queue
+    depth).
+
+        prefetcher = Prefetcher(workers=32)
+        for path, data in prefetcher.read(paths):
+            ...
+        prefetcher.report()
+    """
+
+    def __init__(self, workers: int = 16, depth: int = 0):
+        self.workers = max(1, min(workers, _fd_budget()))
+        self.depth = max(depth or 4 * self.workers, self.workers)
+        self.files = 0
+        self.size = 0
+        self.busy = 0.0
+        self.slowest = 0.0
+        self.stalls = 0
+        self.waited = 0.0
+        self.ready = 0
+        self.peak = 0
+        self._lock = allocate_lock()
+
+    def _read(self, path: PathLike) -> bytes | Exception:
+        start = time.perf_counter()
+        try:
+            with openstd(path, "rb") as fh:
+                data: bytes | Exception = fh.read()
+        except (OSError, ProjectError) as e:
+            data = e
+        elapsed = time.perf_counter() - start
+        metrics.observe("prefetch_read_seconds", elapsed)
+        with self._lock:
+            self.busy += elapsed
+            if elapsed > self.slowest:
+                self.slowest = elapsed
+        return data
+
+    def read(
+        self, paths: t.Iterable[PathLike]
+    ) -> t.Iterator[tuple[PathLike, bytes | Exception]]:
+        """Yield (path, data) for each of paths, in order, reading ahead"""
+        import collections
+        import concurrent.futures
+
+        with concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix="prefetch"
+        ) as executor:
+            pending: t.Deque[tuple[PathLike, concurrent.futures.Future[t.Any]]]
+            pending = collections.deque()
+            try:
+                for path in paths:
+                    pending.append((path, executor.submit(self._read, path)))
+                    if len(pending) >= self.depth:
+                        yield self._next(pending)
+                while pending:
+                    yield self._next(pending)
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def _next(
+        self, pending: t.Deque[tuple[PathLike, t.Any]]
+    ) -> tuple[PathLike, bytes | Exception]:
+        """Pop the first pending file, waiting for it if needed, and count it"""
+        ready = sum(future.done() for _, future in pending)
+        path, future = pending.popleft()
+        if not future.done():
+            start = time.perf_counter()
+            data = future.result()
+            waited = time.perf_counter() - start
+            self.stalls += 1
+            self.waited += waited
+            metrics.observe("prefetch_wait_seconds", waited)
+        else:
+            data = future.result()
+        self.ready += ready
+        self.peak = max(self.peak, ready)
+        self.files += 1
+        metrics.observe("prefetch_queue_depth", ready)
+        if isinstance(data, bytes):
+            self.size += len(data)
+        return path, data
+
+    def report(self) -> None:
+        """Log counters: throughput, read latency and queue depth"""
+        files = self.files or 1
+        log.info(
+            "Prefetch: %d files, %d bytes, %d workers, depth %d",
+            self.files,
+            self.size,
+            self.workers,
+            self.depth,
+        )
+        log.info(
+            "Prefetch: read avg %.3f ms, max %.3f ms; queue avg %.1f, max %d;"
+            " %d stalls, %.3f s waiting",
+            1000 * self.busy / files,
+            1000 * self.slowest,
+            self.ready / files,
+            self.peak,
+            self.stalls,
+            self.waited,
+        )
+
+
+class ResultCache:
+    """On-disk cache of results of processing files, with LRU eviction
+
+    Entries are keyed by the file path, as given and absolute, size and
+    modification time. When only the time changed since the last entry of the
+    path, they fall back to the path and a hash of its contents, so files
+    touched or rewritten with the same content are still hits once their hash
+    is cached. Files are not hashed otherwise, as that reads them twice. All
+    keys also include salt, which should cover everything else results depend
+    on, such as options and version. Only regular files are cached, never stdin.
+
+    Entries are pickled and written atomically, so concurrent runs and crashes
+    never leave partial entries. On close(), least recently used entries are
+    evicted until the cache size is at most max_size bytes, and hits and
+    misses are logged at debug level.
+
+        with ResultCache(salt=(__version__, args.option)) as cache:
+            for result in cache.map(functools.partial(map, process), paths):
+                ...
+    """
+
+    def __init__(
+        self,
+        directory: PathLike | None = None,
+        salt: object = (),
+        max_size: int = 256 * 1024 * 1024,
+    ):
+        if directory is None:
+            base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+            directory = os.path.join(base, "PROJECT")
+        self.directory = os.fsdecode(directory)
+        self.salt = repr(salt)
+        self.max_size = max_size
+        self.hits = 0
+        self.content_hits = 0  # hits by content hash, included in hits
+        self.misses = 0
+        self.errors = 0  # failures reading or writing the cache, ignored
+        self._keys: dict[str, tuple[list[str], int]] = {}  # path: (entry names, size)
+
+    def _entry(self, *key: object) -> str:
+        import hashlib
+
+        return hashlib.sha256(repr((self.salt, *key)).encode()).hexdigest()
+
+    def _content_hash(self, path: str) -> str:
+        import hashlib
+
+        hashed = hashlib.blake2b(digest_size=16)
+        with openstd(path, "rb", compression="none") as fh:
+            for chunk in iter_chunks(fh):
+                hashed.update(chunk)
+        return hashed.hexdigest()
+
+    def _load(self, name: str) -> tuple[bool, t.Any]:
+        import pickle
+
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as fh:
+                value = pickle.load(fh)
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            log.debug("Ignoring invalid cache entry %s: %s", path, e)
+            self.errors += 1
+            return False, None
+        return True, value
+
+    def _save(self, name: str, data: bytes) -> None:
+        import tempfile
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with open(fd, "wb") as fh:
+                    fh.write(data)
+                os.replace(tmp, os.path.join(self.directory, name))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            log.debug("Could not write cache entry: %s", e)
+            self.errors += 1
+
+    def get(self, path: str) -> tuple[bool, t.Any]:
+        """Return (True, result) if path has a cached result, (False, None) if not"""
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            return False, None
+        if path == "-" or not stat.S_ISREG(st.st_mode):
+            return False, None
+        # Results may include the path as given, such as for relative paths
+        abspath = os.path.abspath(path)
+        keys = [self._entry("stat", abspath, path, st.st_size, st.st_mtime_ns)]
+        found, value = self._load(keys[0])
+        if found:
+            self.hits += 1
+            return found, value
+        # Same size as the last entry of path: possibly touched, so check the content
+        if self._load(self._entry("size", abspath, path)) == (True, st.st_size):
+            try:
+                keys.append(self._entry("content", abspath, path, self._content_hash(path)))
+            except OSError:
+                return False, None
+        self._keys[path] = (keys, st.st_size)
+        if len(keys) > 1:
+            found, value = self._load(keys[1])
+            if found:
+                self.hits += 1
+                self.content_hits += 1
+                self.put(path, value)
+                return found, value
+        self.misses += 1
+        return False, None
+
+    def put(self, path: str, value: object) -> None:
+        """Cache the result of path, after a get() miss. Otherwise a no-op"""
+        import pickle
+
+        keys, size = self._keys.pop(path, ([], 0))
+        if not keys:
+            return
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        for name in keys:
+            self._save(name, data)
+        abspath = os.path.abspath(path)
+        self._save(self._entry("size", abspath, path), pickle.dumps(size))
+
+    def map(
+        self, mapper: t.Callable[[list[str]], t.Iterator[R]], paths: t.Iterable[str]
+    ) -> t.Iterator[R]:
+        """
+        Yield results of paths in order, from the cache or by processing them
+
+        mapper is called once with the list of paths not in the cache, and must
+        yield their results in order, such as a partial of parallel_map().
+        Results are cached as they are yielded, except exceptions, such as from
+        returning_errors().
+        """
+        paths = list(paths)
+        found = [self.get(_) for _ in paths]
+        misses = mapper([p for p, (hit, _) in zip(paths, found) if not hit])
+        try:
+            for path, (hit, value) in zip(paths, found):
+                if not hit:
+                    value = next(misses)
+                    if not isinstance(value, BaseException):
+                        self.put(path, value)
+                yield value
+        finally:
+            close = getattr(misses, "close", None)
+            if close is not None:
+                close()
+
+    def evict(self) -> int:
+        """Remove least recently used entries above max_size, return their count"""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+        except FileNotFoundError:
+            return 0
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass  # evicted by a concurrent run
+            total -= size
+            evicted += 1
+        return evicted
+
+    def close(self) -> None:
+        evicted = self.evict()
+        log.debug(
+            "Cache %s: %d hits (%d by content), %d misses, %d evicted, %d errors",
+            self.directory,
+            self.hits,
+            self.content_hits,
+            self.misses,
+            evicted,
+            self.errors,
+        )
+
+    def __enter__(self) -> ResultCache:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()